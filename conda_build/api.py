@@ -31,13 +31,24 @@ def render(recipe_path, config=None, variants=None, permit_unsatisfiable_variant
        templates evaluated.
 
     Returns a list of (metadata, needs_download, needs_reparse in env) tuples"""
-    from conda_build.render import render_recipe, finalize_metadata
+    from conda_build.render import (render_recipe, finalize_metadata, render_cache_key,
+                                    load_cached_render, save_cached_render)
     from conda_build.exceptions import DependencyNeedsBuildingError
     from conda_build.conda_interface import NoPackagesFoundError
     from collections import OrderedDict
     config = get_or_merge_config(config, **kwargs)
     log = _get_logger(__name__)
 
+    cache_key = None
+    if config.render_cache:
+        cache_key = render_cache_key(recipe_path, config, variants=variants,
+                                     permit_unsatisfiable_variants=permit_unsatisfiable_variants,
+                                     finalize=finalize)
+        if cache_key:
+            cached = load_cached_render(cache_key, config)
+            if cached is not None:
+                return cached
+
     metadata_tuples = render_recipe(recipe_path,
                                     no_download_source=config.no_download_source,
                                     config=config, variants=variants,
@@ -58,7 +69,10 @@ def render(recipe_path, config=None, variants=None, permit_unsatisfiable_variant
                         else:
                             raise
                 output_metas[om.dist()] = ((om, download, render_in_env))
-    return list(output_metas.values())
+    metadata_tuples = list(output_metas.values())
+    if cache_key:
+        save_cached_render(cache_key, metadata_tuples, config)
+    return metadata_tuples
 
 
 def output_yaml(metadata, file_path=None):
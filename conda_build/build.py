@@ -9,6 +9,7 @@ import fnmatch
 from glob import glob
 import io
 import json
+import multiprocessing
 import os
 from os.path import isdir, isfile, islink, join
 import re
@@ -17,7 +18,7 @@ import stat
 import subprocess
 import sys
 import tarfile
-import hashlib
+import tempfile
 
 # this is to compensate for a requests idna encoding error.  Conda is a better place to fix,
 #   eventually
@@ -43,8 +44,8 @@ from .conda_interface import conda_private
 from .conda_interface import dist_str_in_index, Dist
 
 from conda_build import __version__
-from conda_build import environ, source, tarcheck, utils
-from conda_build.index import get_build_index
+from conda_build import compression, environ, source, tarcheck, utils
+from conda_build.index import get_build_index, update_build_index
 from conda_build.render import (output_yaml, bldpkg_path, render_recipe, reparse,
                                 distribute_variants, expand_outputs, try_download)
 import conda_build.os_utils.external as external
@@ -90,79 +91,193 @@ def create_post_scripts(m):
         os.chmod(dst, 0o775)
 
 
-def have_prefix_files(files, prefix):
-    '''
-    Yields files that contain the current prefix in them, and modifies them
-    to replace the prefix with a placeholder.
+def find_needles(data, needles):
+    """Search data (bytes or an mmap) for each of needles, returning the set of needles that
+    occur in it.
 
-    :param files: Filenames to check for instances of prefix
-    :type files: list of tuples containing strings (prefix, mode, filename)
+    Each needle gets its own find, which stops at the first occurrence.  That is much faster
+    than scanning once for all of them with a regular expression alternation."""
+    return set(needle for needle in needles if data.find(needle) != -1)
+
+
+def _find_prefix_in_file(f, prefix):
     '''
+    Returns a list of (prefix, mode, filename) tuples for any forms of prefix found in the file
+    f (relative to prefix).  Text files containing the prefix are rewritten in place to use the
+    placeholder instead.
+    '''
+    found = []
+    if f.endswith(('.pyc', '.pyo', '.a')):
+        return found
+    path = join(prefix, f)
+    if not isfile(path):
+        return found
+    if sys.platform != 'darwin' and islink(path):
+        # OSX does not allow hard-linking symbolic links, so we cannot
+        # skip symbolic links (as we can on Linux)
+        return found
+
+    # dont try to mmap an empty file
+    if os.stat(path).st_size == 0:
+        return found
 
     prefix_bytes = prefix.encode(utils.codec)
     prefix_placeholder_bytes = prefix_placeholder.encode(utils.codec)
+    needles = [b'\x00', prefix_bytes, prefix_placeholder_bytes]
     if utils.on_win:
         forward_slash_prefix = prefix.replace('\\', '/')
         forward_slash_prefix_bytes = forward_slash_prefix.encode(utils.codec)
         double_backslash_prefix = prefix.replace('\\', '\\\\')
         double_backslash_prefix_bytes = double_backslash_prefix.encode(utils.codec)
+        needles.extend([forward_slash_prefix_bytes, double_backslash_prefix_bytes])
+
+    fi = open(path, 'rb+')
+    try:
+        mm = utils.mmap_mmap(fi.fileno(), 0, tagname=None, flags=utils.mmap_MAP_PRIVATE)
+    except OSError:
+        mm = fi.read()
+
+    matches = find_needles(mm, needles)
+    mode = 'binary' if b'\x00' in matches else 'text'
+    if mode == 'text':
+        if not utils.on_win and prefix_bytes in matches:
+            # Use the placeholder for maximal backwards compatibility, and
+            # to minimize the occurrences of usernames appearing in built
+            # packages.
+            mm.close()
+            fi.close()
+            rewrite_file_with_new_prefix(path, prefix_bytes, prefix_placeholder_bytes)
+            fi = open(path, 'rb+')
+            mm = utils.mmap_mmap(fi.fileno(), 0, tagname=None, flags=utils.mmap_MAP_PRIVATE)
+            matches = find_needles(mm, needles)
+    if prefix_bytes in matches:
+        found.append((prefix, mode, f))
+    if utils.on_win and forward_slash_prefix_bytes in matches:
+        # some windows libraries use unix-style path separators
+        found.append((forward_slash_prefix, mode, f))
+    elif utils.on_win and double_backslash_prefix_bytes in matches:
+        # some windows libraries have double backslashes as escaping
+        found.append((double_backslash_prefix, mode, f))
+    if prefix_placeholder_bytes in matches:
+        found.append((prefix_placeholder, mode, f))
+    mm.close()
+    fi.close()
+    return found
 
-    for f in files:
-        if f.endswith(('.pyc', '.pyo', '.a')):
-            continue
-        path = join(prefix, f)
-        if not isfile(path):
-            continue
-        if sys.platform != 'darwin' and islink(path):
-            # OSX does not allow hard-linking symbolic links, so we cannot
-            # skip symbolic links (as we can on Linux)
-            continue
 
-        # dont try to mmap an empty file
-        if os.stat(path).st_size == 0:
-            continue
+def _find_prefix_in_file_star(args):
+    # Pool.map only passes a single argument
+    return _find_prefix_in_file(*args)
+
+
+# scanning only a handful of files is faster than starting up worker processes
+PARALLEL_PREFIX_SCAN_MIN_FILES = 100
+
+
+def have_prefix_files(files, prefix, threads=1):
+    '''
+    Yields files that contain the current prefix in them, and modifies them
+    to replace the prefix with a placeholder.
 
-        fi = open(path, 'rb+')
+    :param files: Filenames to check for instances of prefix
+    :type files: list of tuples containing strings (prefix, mode, filename)
+    :param threads: Number of worker processes to scan files with.  Results are yielded in
+                    the same order regardless of this value.
+    :type threads: int
+    '''
+    files = list(files)
+    if threads > 1 and len(files) >= PARALLEL_PREFIX_SCAN_MIN_FILES:
+        # Paths that lead to the same file (hard links, and symlinks on OSX) are only scanned
+        #    once, so that two workers never rewrite the same file at the same time.
+        first_paths, same_file = {}, {}
+        for f in files:
+            path = join(prefix, f)
+            if not isfile(path) or (sys.platform != 'darwin' and islink(path)):
+                continue
+            st = os.stat(path)
+            key = (st.st_dev, st.st_ino)
+            if first_paths.get(key, f) != f:
+                same_file[f] = first_paths[key]
+            else:
+                first_paths[key] = f
+        to_scan = [f for f in files if f not in same_file]
+        pool = multiprocessing.Pool(threads)
         try:
-            mm = utils.mmap_mmap(fi.fileno(), 0, tagname=None, flags=utils.mmap_MAP_PRIVATE)
-        except OSError:
-            mm = fi.read()
-
-        mode = 'binary' if mm.find(b'\x00') != -1 else 'text'
-        if mode == 'text':
-            if not utils.on_win and mm.find(prefix_bytes) != -1:
-                # Use the placeholder for maximal backwards compatibility, and
-                # to minimize the occurrences of usernames appearing in built
-                # packages.
-                rewrite_file_with_new_prefix(path, mm[:], prefix_bytes, prefix_placeholder_bytes)
-                mm.close()
-                fi.close()
-                fi = open(path, 'rb+')
-                mm = utils.mmap_mmap(fi.fileno(), 0, tagname=None, flags=utils.mmap_MAP_PRIVATE)
-        if mm.find(prefix_bytes) != -1:
-            yield (prefix, mode, f)
-        if utils.on_win and mm.find(forward_slash_prefix_bytes) != -1:
-            # some windows libraries use unix-style path separators
-            yield (forward_slash_prefix, mode, f)
-        elif utils.on_win and mm.find(double_backslash_prefix_bytes) != -1:
-            # some windows libraries have double backslashes as escaping
-            yield (double_backslash_prefix, mode, f)
-        if mm.find(prefix_placeholder_bytes) != -1:
-            yield (prefix_placeholder, mode, f)
-        mm.close()
-        fi.close()
-
-
-def rewrite_file_with_new_prefix(path, data, old_prefix, new_prefix):
-    # Old and new prefix should be bytes
+            scanned = pool.map(_find_prefix_in_file_star, [(f, prefix) for f in to_scan],
+                               chunksize=max(1, len(to_scan) // (threads * 4)))
+        finally:
+            pool.terminate()
+            pool.join()
+        scanned = dict(zip(to_scan, scanned))
+        results = ([(p, mode, f) for p, mode, _ in scanned[same_file.get(f, f)]] for f in files)
+    else:
+        results = (_find_prefix_in_file(f, prefix) for f in files)
+
+    for found in results:
+        for item in found:
+            yield item
+
+
+# amount of a file that is held in memory at once while replacing its prefix
+PREFIX_REWRITE_CHUNK_SIZE = 1024 * 1024
 
+
+def _replace_prefix_in_stream(fi, fo, old_prefix, new_prefix,
+                              chunk_size=PREFIX_REWRITE_CHUNK_SIZE):
+    # The last len(old_prefix) - 1 bytes of each chunk may hold the start of an
+    #    instance of old_prefix that continues in the next chunk, so they are carried
+    #    over instead of being written out right away.
+    overlap = len(old_prefix) - 1
+    carry = b''
+    while True:
+        chunk = fi.read(chunk_size)
+        if not chunk:
+            break
+        data = carry + chunk
+        # matches that start at or after this point are not complete in data yet
+        limit = len(data) - overlap
+        start = 0
+        while True:
+            match = data.find(old_prefix, start)
+            if match == -1 or match >= limit:
+                break
+            fo.write(data[start:match])
+            fo.write(new_prefix)
+            start = match + len(old_prefix)
+        end = max(start, limit)
+        fo.write(data[start:end])
+        carry = data[end:]
+    fo.write(carry)
+
+
+def rewrite_file_with_new_prefix(path, old_prefix, new_prefix):
+    """Replace all instances of old_prefix in the file at path with new_prefix.  Prefixes
+    should be bytes.
+
+    The file is processed in chunks, so memory use does not depend on the size of the file.
+    The new contents are written to a temporary file next to path, which then replaces it.
+    Symlinks and files with several hard links are rewritten in place instead, so that
+    they remain links to the same file."""
     st = os.stat(path)
-    data = data.replace(old_prefix, new_prefix)
-    # Save as
-    with open(path, 'wb') as fo:
-        fo.write(data)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as fo:
+            with open(path, 'rb') as fi:
+                _replace_prefix_in_stream(fi, fo, old_prefix, new_prefix)
+        if islink(path) or st.st_nlink > 1:
+            with open(tmp_path, 'rb') as fi:
+                with open(path, 'wb') as fo:
+                    shutil.copyfileobj(fi, fo, PREFIX_REWRITE_CHUNK_SIZE)
+        else:
+            if utils.on_win:
+                # os.rename won't replace an existing file on windows
+                os.unlink(path)
+            os.rename(tmp_path, path)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
     os.chmod(path, stat.S_IMODE(st.st_mode) | stat.S_IWUSR)  # chmod u+w
-    return data
 
 
 # TODO: this is mostly duplicated with the scheme of pin_run_as_build.  Could be refactored
@@ -249,7 +364,8 @@ def write_hash_input(m):
 
 
 def get_files_with_prefix(m, files, prefix):
-    files_with_prefix = sorted(have_prefix_files(files, prefix))
+    files_with_prefix = sorted(have_prefix_files(files, prefix,
+                                                 threads=m.config.threads))
 
     ignore_files = m.ignore_prefix_files()
     ignore_types = set()
@@ -260,14 +376,16 @@ def get_files_with_prefix(m, files, prefix):
     if not m.get_value('build/detect_binary_files_with_prefix', True):
         ignore_types.update((FileMode.binary.name,))
     # files_with_prefix is a list of tuples containing (prefix_placeholder, file_mode)
-    ignore_files.extend(
-        f[2] for f in files_with_prefix if f[1] in ignore_types and f[2] not in ignore_files)
+    ignore_files = set(ignore_files)
+    ignore_files.update(f[2] for f in files_with_prefix if f[1] in ignore_types)
     files_with_prefix = [f for f in files_with_prefix if f[2] not in ignore_files]
     return files_with_prefix
 
 
-def detect_and_record_prefix_files(m, files, prefix):
-    files_with_prefix = get_files_with_prefix(m, files, prefix)
+def detect_and_record_prefix_files(m, files, prefix, files_with_prefix=None):
+    if files_with_prefix is None:
+        files_with_prefix = get_files_with_prefix(m, files, prefix)
+    prefix_index = index_files_with_prefix(files_with_prefix)
     binary_has_prefix_files = m.binary_has_prefix_files()
     text_has_prefix_files = m.has_prefix_files()
 
@@ -287,18 +405,17 @@ def detect_and_record_prefix_files(m, files, prefix):
             for pfix, mode, fn in files_with_prefix:
                 print("Detected hard-coded path in %s file %s" % (mode, fn))
                 fo.write(fmt_str % (pfix, mode, fn))
-
-                if mode == 'binary' and fn in binary_has_prefix_files:
-                    binary_has_prefix_files.remove(fn)
-                elif mode == 'text' and fn in text_has_prefix_files:
-                    text_has_prefix_files.remove(fn)
+    else:
+        prefix_index = {}
 
     # make sure we found all of the files expected
     errstr = ""
     for f in text_has_prefix_files:
-        errstr += "Did not detect hard-coded path in %s from has_prefix_files\n" % f
+        if prefix_index.get(f, (None, None))[1] != 'text':
+            errstr += "Did not detect hard-coded path in %s from has_prefix_files\n" % f
     for f in binary_has_prefix_files:
-        errstr += "Did not detect hard-coded path in %s from binary_has_prefix_files\n" % f
+        if prefix_index.get(f, (None, None))[1] != 'binary':
+            errstr += "Did not detect hard-coded path in %s from binary_has_prefix_files\n" % f
     if errstr:
         raise RuntimeError(errstr)
 
@@ -481,7 +598,7 @@ def create_info_files(m, files, prefix):
     files_with_prefix = get_files_with_prefix(m, files, prefix)
     checksums = create_info_files_json_v1(m, m.config.info_dir, prefix, files, files_with_prefix)
 
-    detect_and_record_prefix_files(m, files, prefix)
+    detect_and_record_prefix_files(m, files, prefix, files_with_prefix)
     write_no_link(m, files)
 
     sources = m.get_section('source')
@@ -518,14 +635,20 @@ def get_short_path(m, target_file):
         return target_file
 
 
-def sha256_checksum(filename, buffersize=65536):
+def sha256_checksum(filename):
     if not isfile(filename):
         return None
-    sha256 = hashlib.sha256()
-    with open(filename, 'rb') as f:
-        for block in iter(lambda: f.read(buffersize), b''):
-            sha256.update(block)
-    return sha256.hexdigest()
+    return utils.file_digests(filename)['sha256']
+
+
+def index_files_with_prefix(files_with_prefix):
+    """Returns a dict mapping each short path in files_with_prefix to its (prefix, mode), so
+    that files can be looked up without scanning the whole list.  If a file was found with
+    more than one prefix, the first one wins, as it does for has_prefix."""
+    prefix_index = {}
+    for prefix, mode, filename in files_with_prefix:
+        prefix_index.setdefault(filename, (prefix, mode))
+    return prefix_index
 
 
 def has_prefix(short_path, files_with_prefix):
@@ -540,12 +663,23 @@ def is_no_link(no_link, short_path):
         return True
 
 
-def get_inode_paths(files, target_short_path, prefix):
-    utils.ensure_list(files)
-    target_short_path_inode = os.lstat(join(prefix, target_short_path)).st_ino
-    hardlinked_files = [sp for sp in files
-                        if os.lstat(join(prefix, sp)).st_ino == target_short_path_inode]
-    return sorted(hardlinked_files)
+def get_inode_index(files, prefix):
+    """Returns a dict mapping each (device, inode) among files to the sorted list of files that
+    share it.  Building this once avoids stat-ing every file again for each hard link."""
+    inode_index = {}
+    for sp in files:
+        st = os.lstat(join(prefix, sp))
+        inode_index.setdefault((st.st_dev, st.st_ino), []).append(sp)
+    for paths in inode_index.values():
+        paths.sort()
+    return inode_index
+
+
+def get_inode_paths(files, target_short_path, prefix, inode_index=None):
+    if inode_index is None:
+        inode_index = get_inode_index(files, prefix)
+    st = os.lstat(join(prefix, target_short_path))
+    return list(inode_index[(st.st_dev, st.st_ino)])
 
 
 def path_type(path):
@@ -555,8 +689,11 @@ def path_type(path):
 def build_info_files_json_v1(m, prefix, files, files_with_prefix):
     no_link_files = m.get_value('build/no_link')
     files_json = []
+    prefix_index = index_files_with_prefix(files_with_prefix)
+    # only built when the first hard link is found
+    inode_index = None
     for fi in sorted(files):
-        prefix_placeholder, file_mode = has_prefix(fi, files_with_prefix)
+        prefix_placeholder, file_mode = prefix_index.get(fi, (None, None))
         path = os.path.join(prefix, fi)
         file_info = {
             "_path": get_short_path(m, fi),
@@ -572,7 +709,9 @@ def build_info_files_json_v1(m, prefix, files, files_with_prefix):
             file_info["file_mode"] = file_mode
         if file_info.get("path_type") == PathType.hardlink and CrossPlatformStLink.st_nlink(
                 join(prefix, fi)) > 1:
-            inode_paths = get_inode_paths(files, fi, prefix)
+            if inode_index is None:
+                inode_index = get_inode_index(files, prefix)
+            inode_paths = get_inode_paths(files, fi, prefix, inode_index)
             file_info["inode_paths"] = inode_paths
         files_json.append(file_info)
     return files_json
@@ -715,7 +854,6 @@ def bundle_conda(output, metadata, env, **kw):
 
     with TemporaryDirectory() as tmp:
         tmp_path = os.path.join(tmp, os.path.basename(output_filename))
-        t = tarfile.open(tmp_path, 'w:bz2')
 
         def order(f):
             # we don't care about empty files so send them back via 100000
@@ -724,12 +862,16 @@ def bundle_conda(output, metadata, env, **kw):
             info_order = int(os.path.dirname(f) != 'info')
             return info_order, fsize
 
-        # add files in order of a) in info directory, b) increasing size so
-        # we can access small manifest or json files without decompressing
-        # possible large binary or data files
-        for f in sorted(files, key=order):
-            t.add(join(metadata.config.host_prefix, f), f)
-        t.close()
+        with open(tmp_path, 'wb') as fo:
+            with compression.get_compressor(fo, 'bz2', level=metadata.config.compression_level,
+                                            threads=metadata.config.threads) as compressor:
+                t = tarfile.open(fileobj=compressor, mode='w|')
+                # add files in order of a) in info directory, b) increasing size so
+                # we can access small manifest or json files without decompressing
+                # possible large binary or data files
+                for f in sorted(files, key=order):
+                    t.add(join(metadata.config.host_prefix, f), f)
+                t.close()
 
         # we're done building, perform some checks
         tarcheck.check_all(tmp_path, metadata.config)
@@ -759,7 +901,7 @@ def bundle_conda(output, metadata, env, **kw):
         #    a major bottleneck.
         utils.copy_into(tmp_path, final_output, metadata.config.timeout,
                         locking=False)
-    update_index(output_folder, config=metadata.config)
+    update_index(output_folder, config=metadata.config, filenames=[output_filename])
 
     # HACK: conda really wants a noarch folder to be around.  Create it as necessary.
     if os.path.basename(output_folder) != 'noarch':
@@ -767,7 +909,9 @@ def bundle_conda(output, metadata, env, **kw):
             os.makedirs(os.path.join(os.path.dirname(output_folder), 'noarch'))
         except OSError:
             pass
-        update_index(os.path.join(os.path.dirname(output_folder), 'noarch'), config=metadata.config)
+        # nothing new in noarch - this only makes sure that it has been indexed
+        update_index(os.path.join(os.path.dirname(output_folder), 'noarch'), config=metadata.config,
+                     filenames=[])
 
     # remove info files from host prefix. We do not remove the actual package's files as subsequent
     # builds may well need them. In other words, the caller manages the files in output['checksums']
@@ -879,7 +1023,8 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
             host_index, host_ts = get_build_index(m.config, m.config.host_subdir)
             host_ms_deps = m.ms_depends('host')
             host_actions = environ.get_install_actions(m.config.host_prefix, host_index,
-                                                       host_ms_deps, m.config, timestamp=host_ts)
+                                                       host_ms_deps, m.config, timestamp=host_ts,
+                                                       subdir=m.config.host_subdir)
             environ.create_env(m.config.host_prefix, host_actions, config=m.config,
                                subdir=m.config.host_subdir)
 
@@ -887,7 +1032,8 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
         index, index_timestamp = get_build_index(m.config, m.config.build_subdir)
         build_actions = environ.get_install_actions(m.config.build_prefix, index,
                                                     build_ms_deps, m.config,
-                                                    timestamp=index_timestamp)
+                                                    timestamp=index_timestamp,
+                                                    subdir=m.config.build_subdir)
         if (not m.config.dirty or not os.path.isdir(m.config.build_prefix) or
                 not os.listdir(m.config.build_prefix)):
             environ.create_env(m.config.build_prefix, build_actions, config=m.config,
@@ -1024,6 +1170,8 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
                 utils.copy_into(os.path.join(m.config.host_prefix, f),
                                 os.path.join(prefix_files_backup, f),
                                 symlinks=True)
+            # prefix: stats of the files in it right after it was last set up for an output
+            baseline_files = {}
             for (output_d, m) in outputs:
                 if (top_level_meta.name() == output_d.get('name') and not (output_d.get('files') or
                                                                            output_d.get('script'))):
@@ -1034,8 +1182,6 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
                 pkg_path = bldpkg_path(m)
                 if pkg_path not in built_packages and pkg_path not in new_pkgs:
                     if post is None:
-                        utils.rm_rf(m.config.host_prefix)
-                        utils.rm_rf(m.config.build_prefix)
                         utils.rm_rf(m.config.test_prefix)
 
                     if m.config.has_separate_host_prefix:
@@ -1043,41 +1189,60 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
                             raise RuntimeError("Non-native subdir support only in conda >= 4.3.2")
                         host_index, host_ts = get_build_index(m.config, m.config.host_subdir)
                         host_ms_deps = m.ms_depends('host')
-                        host_actions = environ.get_install_actions(m.config.host_prefix, host_index,
-                                                                host_ms_deps, m.config,
-                                                                timestamp=host_ts)
-                        environ.create_env(m.config.host_prefix, host_actions, config=m.config,
-                                        subdir=subdir)
+                        if post is None:
+                            host_actions = _solve_for_new_env(host_index, host_ms_deps,
+                                                              m.config, host_ts,
+                                                              m.config.host_subdir)
+                            environ.update_env(m.config.host_prefix, host_actions, m.config,
+                                               subdir=subdir,
+                                               baseline_files=baseline_files.get(
+                                                   m.config.host_prefix))
+                        else:
+                            host_actions = environ.get_install_actions(m.config.host_prefix,
+                                                                    host_index,
+                                                                    host_ms_deps, m.config,
+                                                                    timestamp=host_ts,
+                                                                    subdir=m.config.host_subdir)
+                            environ.create_env(m.config.host_prefix, host_actions,
+                                               config=m.config, subdir=subdir)
 
                     sub_build_ms_deps = m.ms_depends('build')
                     index, index_timestamp = get_build_index(m.config, m.config.build_subdir)
-                    build_actions = environ.get_install_actions(m.config.build_prefix, index,
-                                                                sub_build_ms_deps, m.config,
-                                                                timestamp=index_timestamp)
-                    environ.create_env(m.config.build_prefix, build_actions, config=m.config,
-                                    subdir=m.config.build_subdir)
-
-                    # copies the backed-up new prefix files into the newly created host env
+                    if post is None:
+                        build_actions = _solve_for_new_env(index, sub_build_ms_deps, m.config,
+                                                           index_timestamp, m.config.build_subdir)
+                        environ.update_env(m.config.build_prefix, build_actions, m.config,
+                                           subdir=m.config.build_subdir,
+                                           baseline_files=baseline_files.get(
+                                               m.config.build_prefix))
+                    else:
+                        build_actions = environ.get_install_actions(m.config.build_prefix, index,
+                                                                    sub_build_ms_deps, m.config,
+                                                                    timestamp=index_timestamp,
+                                                                    subdir=m.config.build_subdir)
+                        environ.create_env(m.config.build_prefix, build_actions,
+                                           config=m.config, subdir=m.config.build_subdir)
+
+                    # copies the backed-up new prefix files into the host env
                     for f in new_prefix_files:
                         utils.copy_into(os.path.join(prefix_files_backup, f),
                                         os.path.join(m.config.host_prefix, f),
-                                        symlinks=True)
+                                        symlinks=True, clobber=True)
+                    if post is None:
+                        for prefix in set((m.config.host_prefix, m.config.build_prefix)):
+                            baseline_files[prefix] = environ.prefix_file_stats(prefix)
 
                     built_package = bundlers[output_d.get('type', 'conda')](output_d, m, env)
                     new_pkgs[built_package] = (output_d, m)
 
-                    # must rebuild index because conda has no way to incrementally add our last
-                    #    package to the index.
-
+                    # later outputs may depend on this one, so it is added to the cached
+                    #    index (the rest of which is still good)
                     subdir = ('noarch' if (m.noarch or m.noarch_python)
                               else m.config.host_subdir)
                     if host_index:
-                        host_index, host_ts = get_build_index(config=m.config,
-                                                              subdir=subdir,
-                                                              clear_cache=True)
-                    index, index_timestamp = get_build_index(config=m.config,
-                                                             subdir=subdir,
-                                                             clear_cache=True)
+                        host_index, host_ts = update_build_index(config=m.config,
+                                                                 subdir=subdir)
+                    index, index_timestamp = update_build_index(config=m.config, subdir=subdir)
     else:
         print("STOPPING BUILD BEFORE POST:", m.dist())
 
@@ -1085,6 +1250,14 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
     return new_pkgs
 
 
+def _solve_for_new_env(index, specs, config, timestamp, subdir):
+    """Returns the actions that would create an environment with specs from scratch.  They are
+    solved for an empty prefix, so that packages in an existing env don't sway the solver."""
+    with TemporaryDirectory(prefix="_solve_") as tmpdir:
+        return environ.get_install_actions(tmpdir, index, list(specs), config,
+                                           timestamp=timestamp, subdir=subdir)
+
+
 def guess_interpreter(script_filename):
     # -l is needed for MSYS2 as the login scripts set some env. vars (TMP, TEMP)
     # Since the MSYS2 installation is probably a set of conda packages we do not
@@ -1260,7 +1433,8 @@ def test(recipedir_or_package_or_metadata, config, move_broken=True):
                   else metadata.config.host_subdir)
         index, index_ts = get_build_index(metadata.config, subdir)
         actions = environ.get_install_actions(metadata.config.test_prefix, index,
-                                                specs, metadata.config, timestamp=index_ts)
+                                                specs, metadata.config, timestamp=index_ts,
+                                                subdir=subdir)
         environ.create_env(metadata.config.test_prefix, actions, config=metadata.config,
                            subdir=subdir)
 
@@ -213,6 +213,27 @@ different sets of packages."""
         #     had enough time to build long-prefix length packages.
         default=255, type=int,
     )
+    p.add_argument(
+        "--threads", dest='_threads', type=int,
+        help=("Number of worker processes to use for parallelizable steps of packaging, such as "
+              "scanning files for the build prefix and compressing packages.  Defaults to 1; 0 "
+              "uses one per CPU."),
+    )
+    p.add_argument(
+        "--compression-level", type=int,
+        help=("Compression level for the package tarball (1-9 for bz2).  Lower levels are "
+              "faster but produce bigger packages.  Defaults to 9."),
+    )
+    p.add_argument(
+        "--solve-cache-on-disk", action="store_true",
+        help=("Keep the results of dependency solves on disk (in the croot), so that later "
+              "builds can reuse them.  Solves are always reused within one build."),
+    )
+    p.add_argument(
+        "--no-env-templates", dest="env_templates", action="store_false", default=True,
+        help=("Always create build, host and test environments by linking their packages, "
+              "rather than cloning an earlier environment with the same packages."),
+    )
     p.add_argument(
         "--no-locking", dest='locking', default=True, action="store_false",
         help=("Disable locking, to avoid unresolved race condition issues.  Unsafe to run multiple"
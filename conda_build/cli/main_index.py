@@ -48,6 +48,13 @@ def parse_args(args):
         default=True,
         help="Don't remove entries for files that don't exist.",
     )
+    p.add_argument(
+        '--threads',
+        dest='_threads',
+        type=int,
+        help="Number of worker processes to read and hash packages with.  Defaults to 1; 0 "
+        "uses one per CPU.",
+    )
 
     args = p.parse_args(args)
     return p, args
@@ -106,6 +106,16 @@ source to try fill in related template variables.",
                             "yours to handle.  Any variants with overlapping names within a "
                             "build will clobber each other.")
     )
+    p.add_argument(
+        "--render-jobs", dest="render_jobs", type=int, default=1,
+        help=("Number of worker processes to render variants of a recipe with.  The rendered "
+              "variants are the same, in the same order, as when rendering them one at a time.")
+    )
+    p.add_argument(
+        "--no-render-cache", dest="render_cache", action="store_false", default=True,
+        help=("Always render the recipe, rather than reusing the result of an earlier render of "
+              "the same recipe, variants, config and channel contents.")
+    )
 
     add_parser_channels(p)
     return p
@@ -0,0 +1,256 @@
+'''
+Compressors for writing package archives, optionally using several processes.
+'''
+
+from __future__ import absolute_import, division, print_function
+
+import binascii
+import bz2
+from collections import deque
+import multiprocessing
+
+try:
+    import lzma
+except ImportError:
+    # python 2 without backports.lzma
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# markers from the bzip2 format
+BZ2_EOS_MAGIC = 0x177245385090
+BZ2_TRAILER_BITS = 48 + 32
+
+
+def _bytes_to_int(data):
+    return int(binascii.hexlify(data), 16) if data else 0
+
+
+def _int_to_bytes(value, length):
+    return binascii.unhexlify('%0*x' % (length * 2, value)) if length else b''
+
+
+def bz2_chunk_size(level):
+    """Largest amount of input that bzip2 is certain to compress into a single block.  Blocks
+    hold 100k * level bytes, less a little slack, after an initial run-length encoding pass
+    that can grow the data by up to 5/4."""
+    return (100000 * level - 19) * 4 // 5 - 5
+
+
+def _compress_bz2_block(args):
+    """Compress chunk into a bzip2 stream of a single block, and pull that block out of it.
+
+    Returns (block crc, block bits as an int, number of bits in the block).  Blocks are not
+    byte-aligned, so they are carried as integers to be shifted into place by the caller."""
+    chunk, level = args
+    data = bz2.compress(chunk, level)
+    # the 4 byte stream header ('BZh' + level) is followed by the 48 bit block magic and the
+    #    block's crc
+    crc = _bytes_to_int(data[10:14])
+    value = _bytes_to_int(data[4:])
+    # the stream ends with the end of stream magic, the combined crc of all blocks (which is the
+    #    block crc for a single block), and up to 7 bits of padding
+    trailer = (BZ2_EOS_MAGIC << 32) | crc
+    for padding in range(8):
+        if (value >> padding) & ((1 << BZ2_TRAILER_BITS) - 1) == trailer:
+            break
+    else:
+        raise RuntimeError("bz2 compressed chunk did not produce exactly one block")
+    nbits = (len(data) - 4) * 8 - BZ2_TRAILER_BITS - padding
+    return crc, value >> (BZ2_TRAILER_BITS + padding), nbits
+
+
+def _compress_xz_chunk(args):
+    chunk, level = args
+    return lzma.compress(chunk, format=lzma.FORMAT_XZ, preset=level)
+
+
+class ChunkedCompressor(object):
+    """Write-only file object that compresses fixed size chunks of the data written to it,
+    in a pool of worker processes when threads > 1.
+
+    Chunks are independent of the number of threads, and results are written in order, so the
+    output is the same no matter how many processes compress it."""
+    chunk_size = 4 * 1024 * 1024
+    default_level = 9
+
+    def __init__(self, fileobj, level=None, threads=1):
+        self.fileobj = fileobj
+        self.level = self.default_level if level is None else level
+        self.threads = threads
+        self._buffer = []
+        self._buffered = 0
+        self._pending = deque()
+        self._pool = None
+
+    def _compress_chunk(self, chunk):
+        raise NotImplementedError
+
+    def _write_compressed(self, result):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+    def _submit(self, chunk, last=False):
+        # don't start up worker processes just to compress a single chunk
+        if self.threads > 1 and (self._pool or not last):
+            if not self._pool:
+                self._pool = multiprocessing.Pool(self.threads)
+            self._pending.append(self._pool.apply_async(self._compress_chunk,
+                                                        ((chunk, self.level),)))
+            # bound the amount of data held in memory
+            while len(self._pending) > 2 * self.threads:
+                self._write_compressed(self._pending.popleft().get())
+        else:
+            self._write_compressed(self._compress_chunk((chunk, self.level)))
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.chunk_size:
+            data = b''.join(self._buffer)
+            offset = 0
+            while len(data) - offset >= self.chunk_size:
+                self._submit(data[offset:offset + self.chunk_size])
+                offset += self.chunk_size
+            self._buffer = [data[offset:]]
+            self._buffered = len(data) - offset
+
+    def close(self):
+        try:
+            if self._buffered:
+                self._submit(b''.join(self._buffer), last=True)
+                self._buffer, self._buffered = [], 0
+            while self._pending:
+                self._write_compressed(self._pending.popleft().get())
+            self._finish()
+        finally:
+            if self._pool:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, e_type, e_value, traceback):
+        if e_type:
+            # don't write out a partial archive, but do clean up the workers
+            if self._pool:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+        else:
+            self.close()
+
+
+class BZ2Compressor(ChunkedCompressor):
+    """Writes a standard, single stream bzip2 file.
+
+    Each chunk is compressed into exactly one bzip2 block, and the blocks are then spliced
+    together into one stream with a combined crc, the same way bzip2 itself lays them out.
+    Unlike concatenating separate bzip2 streams (as pbzip2 does), this can be read by every bz2
+    decompressor, including python 2's."""
+    default_level = 9
+
+    def __init__(self, fileobj, level=None, threads=1):
+        super(BZ2Compressor, self).__init__(fileobj, level=level, threads=threads)
+        self.chunk_size = bz2_chunk_size(self.level)
+        self._combined_crc = 0
+        self._bits = 0
+        self._nbits = 0
+        self.fileobj.write(b'BZh' + str(self.level).encode('ascii'))
+
+    _compress_chunk = staticmethod(_compress_bz2_block)
+
+    def _write_bits(self, bits, nbits):
+        self._bits = (self._bits << nbits) | bits
+        self._nbits += nbits
+        # write out all whole bytes, keeping any leftover bits for the next block
+        nbytes, leftover = divmod(self._nbits, 8)
+        if nbytes:
+            self.fileobj.write(_int_to_bytes(self._bits >> leftover, nbytes))
+            self._bits &= (1 << leftover) - 1
+            self._nbits = leftover
+
+    def _write_compressed(self, result):
+        crc, bits, nbits = result
+        self._combined_crc = (((self._combined_crc << 1) | (self._combined_crc >> 31)) &
+                              0xffffffff) ^ crc
+        self._write_bits(bits, nbits)
+
+    def _finish(self):
+        self._write_bits((BZ2_EOS_MAGIC << 32) | self._combined_crc, BZ2_TRAILER_BITS)
+        if self._nbits:
+            self._write_bits(0, 8 - self._nbits)
+
+
+class XZCompressor(ChunkedCompressor):
+    """Writes a series of concatenated xz streams, which xz decompressors read as one."""
+    default_level = 6
+
+    def __init__(self, fileobj, level=None, threads=1):
+        if not lzma:
+            raise ValueError("xz compression requires the lzma module")
+        super(XZCompressor, self).__init__(fileobj, level=level, threads=threads)
+        self._empty = True
+
+    _compress_chunk = staticmethod(_compress_xz_chunk)
+
+    def _write_compressed(self, result):
+        self._empty = False
+        self.fileobj.write(result)
+
+    def _finish(self):
+        if self._empty:
+            # an xz file needs at least one stream, even if it is empty
+            self._write_compressed(_compress_xz_chunk((b'', self.level)))
+
+
+class ZstdCompressor(object):
+    """Writes a zstd frame, using zstd's own worker threads when threads > 1."""
+    default_level = 19
+
+    def __init__(self, fileobj, level=None, threads=1):
+        if not zstandard:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.fileobj = fileobj
+        self.level = self.default_level if level is None else level
+        compressor = zstandard.ZstdCompressor(level=self.level,
+                                              threads=threads if threads > 1 else 0)
+        self._compressobj = compressor.compressobj()
+
+    def write(self, data):
+        self.fileobj.write(self._compressobj.compress(data))
+
+    def close(self):
+        self.fileobj.write(self._compressobj.flush())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, e_type, e_value, traceback):
+        if not e_type:
+            self.close()
+
+
+COMPRESSORS = {
+    'bz2': BZ2Compressor,
+    'xz': XZCompressor,
+    'zstd': ZstdCompressor,
+}
+
+
+def get_compressor(fileobj, compression='bz2', level=None, threads=1):
+    """Returns a write-only file object that writes data compressed with the given compression
+    to fileobj.  It must be closed to finish the compressed stream, but does not close
+    fileobj."""
+    if compression not in COMPRESSORS:
+        raise ValueError("Unknown compression '{0}'.  Valid choices are: {1}"
+                         .format(compression, ', '.join(sorted(COMPRESSORS))))
+    return COMPRESSORS[compression](fileobj, level=level, threads=threads)
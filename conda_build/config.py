@@ -6,6 +6,7 @@ from __future__ import absolute_import, division, print_function
 import copy
 from collections import namedtuple
 import math
+import multiprocessing
 import os
 from os.path import abspath, expanduser, join
 import shutil
@@ -78,6 +79,22 @@ DEFAULTS = [Setting('activate', True),
             Setting('_host_arch', None),
             Setting('has_separate_host_prefix', False),
             Setting('filename_hashing', True),
+            Setting('_threads', 1),
+            # None means the compressor's default level
+            Setting('compression_level', None),
+            # number of worker processes to render variants with
+            Setting('render_jobs', 1),
+            Setting('render_cache', True),
+            # bytes
+            Setting('render_cache_size', 100 * 1024 * 1024),
+            # solves are always cached in memory; this adds a tier on disk, shared across runs
+            Setting('solve_cache_on_disk', False),
+            # bytes
+            Setting('solve_cache_size', 100 * 1024 * 1024),
+            # create new environments by cloning earlier ones with the same packages
+            Setting('env_templates', True),
+            # number of environment templates kept
+            Setting('env_templates_max', 8),
 
             Setting('index', None),
 
@@ -372,6 +389,24 @@ class Config(object):
     def prefix_length(self, length):
         self._prefix_length = length
 
+    @property
+    def threads(self):
+        """Number of worker processes to use for parallelizable steps, such as scanning files
+        for the build prefix and compressing packages.  Defaults to 1 (no worker processes); 0
+        means one per CPU.  Always 1 inside a daemonic process (like a multiprocessing pool
+        worker), which can't start processes of its own."""
+        if multiprocessing.current_process().daemon:
+            return 1
+        if not self._threads:
+            # circular import - environ imports index, which needs config
+            from .environ import get_cpu_count
+            return int(get_cpu_count())
+        return int(self._threads)
+
+    @threads.setter
+    def threads(self, value):
+        self._threads = value
+
     @property
     def _short_host_prefix(self):
         return join(self.build_folder, '_h_env')
@@ -510,10 +545,31 @@ class Config(object):
         _ensure_dir(path)
         return path
 
+    @property
+    def render_cache_dir(self):
+        """Where rendered recipes are cached between runs"""
+        path = join(self.croot, 'render_cache')
+        _ensure_dir(path)
+        return path
+
+    @property
+    def solve_cache_dir(self):
+        """Where solved environments are cached between runs, with solve_cache_on_disk"""
+        path = join(self.croot, 'solve_cache')
+        _ensure_dir(path)
+        return path
+
+    @property
+    def env_templates_dir(self):
+        """Where pristine copies of created environments are kept, to clone new ones from"""
+        path = join(self.croot, 'env_templates')
+        _ensure_dir(path)
+        return path
+
     @property
     def work_dir(self):
         """Where the source for the build is extracted/copied to."""
-        path = join(self.build_folder, 'work')
+        path = getattr(self, '_work_dir', None) or join(self.build_folder, 'work')
         _ensure_dir(path)
         # if os.path.isdir(path):
         #     lst = [fn for fn in os.listdir(path) if not fn.startswith('.')]
@@ -523,6 +579,11 @@ class Config(object):
         #             return dir_path
         return path
 
+    @work_dir.setter
+    def work_dir(self, path):
+        """Use path instead of the build folder's work dir.  None goes back to that."""
+        self._work_dir = path
+
     @property
     def test_dir(self):
         """The temporary folder where test files are copied to, and where tests start execution"""
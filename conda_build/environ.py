@@ -1,13 +1,19 @@
 from __future__ import absolute_import, division, print_function
 
 import contextlib
+import copy
 from glob import glob
+import hashlib
 import json
 import logging
+import mmap
 import multiprocessing
 import os
 import re
+import shlex
+import shutil
 import sys
+import tempfile
 import warnings
 from collections import defaultdict
 from os.path import join, normpath
@@ -17,7 +23,7 @@ import subprocess
 from .conda_interface import text_type, PY3  # noqa
 from .conda_interface import root_dir, symlink_conda, pkgs_dirs
 from .conda_interface import PaddingError, LinkError, LockError, NoPackagesFoundError, CondaError
-from .conda_interface import package_cache
+from .conda_interface import package_cache, linked
 from .conda_interface import install_actions, display_actions, execute_actions, execute_plan
 from .conda_interface import memoized
 from .conda_interface import MatchSpec
@@ -27,7 +33,7 @@ from conda_build.os_utils import external
 from conda_build import utils
 from conda_build.features import feature_list
 from conda_build.utils import prepend_bin_path, ensure_list
-from conda_build.index import get_build_index
+from conda_build.index import get_build_index, index_fingerprint
 from conda_build.exceptions import DependencyNeedsBuildingError
 from conda_build.variants import get_default_variants
 
@@ -635,7 +641,87 @@ def _ensure_valid_spec(spec):
     return spec
 
 
-def get_install_actions(prefix, index, specs, config, retries=0, timestamp=0):
+# solve key (see _solve_cache_key): actions, as install_actions returned them
+_solve_cache = utils.LRUCache(maxsize=64)
+
+
+def _solve_cache_key(prefix, index, specs, subdir):
+    """Returns a key for the result of solving specs with index in prefix.  Besides the specs and
+    the packages in the index, a solve only depends on what is already linked in prefix, not on
+    the prefix's path."""
+    linked = []
+    meta_dir = join(prefix, 'conda-meta')
+    if os.path.isdir(meta_dir):
+        linked = sorted(fn for fn in os.listdir(meta_dir) if fn.endswith('.json'))
+    features = sorted(feature for feature, value in feature_list if value)
+    key = json.dumps([sorted(text_type(spec) for spec in specs), subdir, index_fingerprint(index),
+                      features, linked])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _dist_name(dist):
+    """name-version-build of dist, without its channel"""
+    return getattr(dist, 'dist_name', None) or text_type(dist).split('::')[-1]
+
+
+def _is_extracted(dist):
+    return any(os.path.isdir(join(pkgs_dir, _dist_name(dist), 'info')) for pkgs_dir in pkgs_dirs)
+
+
+def _load_cached_solve(key, prefix, config):
+    """Returns a copy of the actions cached under key, made to fit prefix and the current
+    package cache, or None if there are none that can be used."""
+    actions = _solve_cache.get(key)
+    if actions is None and config.solve_cache_on_disk:
+        import pickle
+        path = join(config.solve_cache_dir, key + '.pickle')
+        try:
+            with open(path, 'rb') as f:
+                actions = pickle.load(f)
+            # this is what eviction goes by
+            os.utime(path, None)
+        except Exception:
+            # missing, or left unreadable by another version of python or conda
+            return None
+        _solve_cache[key] = actions
+    if actions is None:
+        return None
+
+    actions = copy.deepcopy(actions)
+    if 'PREFIX' in actions:
+        actions['PREFIX'] = prefix
+    # packages were fetched and extracted when the cached actions were first executed, but they
+    #    may have been removed from the package cache since
+    extracting = set(text_type(dist) for dist in actions.get('EXTRACT', []))
+    if not all(_is_extracted(dist) or text_type(dist) in extracting
+               for dist in actions.get('LINK', [])):
+        return None
+    for op in ('FETCH', 'EXTRACT'):
+        if op in actions:
+            actions[op] = [dist for dist in actions[op] if not _is_extracted(dist)]
+    return actions
+
+
+def _save_cached_solve(key, actions, config):
+    try:
+        _solve_cache[key] = copy.deepcopy(actions)
+    except Exception as e:
+        utils.get_logger(__name__).debug("Not caching solve: %s", e)
+        return
+    if config.solve_cache_on_disk:
+        path = join(config.solve_cache_dir, key + '.pickle')
+        try:
+            utils.write_pickle(actions, path)
+        except Exception as e:
+            utils.get_logger(__name__).debug("Not caching solve on disk: %s", e)
+            return
+        utils.trim_cache_dir(config.solve_cache_dir, config.solve_cache_size)
+
+
+def get_install_actions(prefix, index, specs, config, retries=0, timestamp=0, subdir=None):
+    """Solves specs with index for prefix.  Identical solves are cached (in memory, and on disk
+    with config.solve_cache_on_disk), keyed on the specs, subdir, the packages in index and the
+    enabled features."""
     log = utils.get_logger(__name__)
     if config.verbose:
         capture = contextlib.contextmanager(lambda: (yield))
@@ -647,45 +733,53 @@ def get_install_actions(prefix, index, specs, config, retries=0, timestamp=0):
             specs.append('%s@' % feature)
     specs = [_ensure_valid_spec(spec) for spec in specs]
     if specs:
-        # this is hiding output like:
-        #    Fetching package metadata ...........
-        #    Solving package specifications: ..........
-        with capture():
-            try:
-                actions = install_actions(prefix, index, specs, force=True)
-                # Experimenting with getting conda to create fewer Resolve objects
-                #   Experiment failed, seemingly due to conda's statefulness.  Packages could
-                #   not be found.
-                # index_timestamp=timestamp)
-            except NoPackagesFoundError as exc:
-                raise DependencyNeedsBuildingError(exc)
-            except (SystemExit, PaddingError, LinkError, DependencyNeedsBuildingError,
-                    CondaError, AssertionError) as exc:
-                if 'lock' in str(exc):
-                    log.warn("failed to get install actions, retrying.  exception was: %s",
-                             str(exc))
-                elif ('requires a minimum conda version' in str(exc) or
-                        'link a source that does not' in str(exc) or
-                        isinstance(exc, AssertionError)):
-                    locks = utils.get_conda_operation_locks(config)
-                    with utils.try_acquire_locks(locks, timeout=config.timeout):
-                        pkg_dir = str(exc)
-                        folder = 0
-                        while os.path.dirname(pkg_dir) not in pkgs_dirs and folder < 20:
-                            pkg_dir = os.path.dirname(pkg_dir)
-                            folder += 1
-                        log.warn("I think conda ended up with a partial extraction for %s.  "
-                                    "Removing the folder and retrying", pkg_dir)
-                        if pkg_dir in pkgs_dirs and os.path.isdir(pkg_dir):
-                            utils.rm_rf(pkg_dir)
-                if retries < config.max_env_retry:
-                    log.warn("failed to get install actions, retrying.  exception was: %s",
-                             str(exc))
-                    actions = get_install_actions(prefix, index, specs, config,
-                                                    retries=retries + 1, timestamp=timestamp)
-                else:
-                    log.error("Failed to get install actions, max retries exceeded.")
-                    raise
+        cache_key = _solve_cache_key(prefix, index, specs, subdir)
+        cached_actions = _load_cached_solve(cache_key, prefix, config)
+        if cached_actions is not None:
+            log.debug("Reusing cached solve for %s", prefix)
+            actions = cached_actions
+        else:
+            # this is hiding output like:
+            #    Fetching package metadata ...........
+            #    Solving package specifications: ..........
+            with capture():
+                try:
+                    actions = install_actions(prefix, index, specs, force=True)
+                    # Experimenting with getting conda to create fewer Resolve objects
+                    #   Experiment failed, seemingly due to conda's statefulness.  Packages could
+                    #   not be found.
+                    # index_timestamp=timestamp)
+                    _save_cached_solve(cache_key, actions, config)
+                except NoPackagesFoundError as exc:
+                    raise DependencyNeedsBuildingError(exc)
+                except (SystemExit, PaddingError, LinkError, DependencyNeedsBuildingError,
+                        CondaError, AssertionError) as exc:
+                    if 'lock' in str(exc):
+                        log.warn("failed to get install actions, retrying.  exception was: %s",
+                                 str(exc))
+                    elif ('requires a minimum conda version' in str(exc) or
+                            'link a source that does not' in str(exc) or
+                            isinstance(exc, AssertionError)):
+                        locks = utils.get_conda_operation_locks(config)
+                        with utils.try_acquire_locks(locks, timeout=config.timeout):
+                            pkg_dir = str(exc)
+                            folder = 0
+                            while os.path.dirname(pkg_dir) not in pkgs_dirs and folder < 20:
+                                pkg_dir = os.path.dirname(pkg_dir)
+                                folder += 1
+                            log.warn("I think conda ended up with a partial extraction for %s.  "
+                                        "Removing the folder and retrying", pkg_dir)
+                            if pkg_dir in pkgs_dirs and os.path.isdir(pkg_dir):
+                                utils.rm_rf(pkg_dir)
+                    if retries < config.max_env_retry:
+                        log.warn("failed to get install actions, retrying.  exception was: %s",
+                                 str(exc))
+                        actions = get_install_actions(prefix, index, specs, config,
+                                                      retries=retries + 1, timestamp=timestamp,
+                                                      subdir=subdir)
+                    else:
+                        log.error("Failed to get install actions, max retries exceeded.")
+                        raise
         if config.disable_pip:
             actions['LINK'] = [spec for spec in actions['LINK']
                                 if not spec.startswith('pip-') and
@@ -694,10 +788,230 @@ def get_install_actions(prefix, index, specs, config, retries=0, timestamp=0):
     return actions
 
 
+def _env_template_key(actions, index, subdir):
+    """Returns the key of the environment template for the packages that actions link, or None
+    if actions do anything besides creating a new environment.  The key has the md5 of each
+    package as well as its name, as local packages are rebuilt with the same name."""
+    if not actions.get('LINK') or actions.get('UNLINK'):
+        return None
+    packages = []
+    for dist in actions['LINK']:
+        record = index.get(dist)
+        md5 = record.get('md5') if record else None
+        if not md5:
+            return None
+        packages.append([text_type(dist), md5])
+    key = json.dumps([sorted(packages), subdir])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _package_has_prefix(dist):
+    """Returns {path: 'text' or 'binary'} for the files of dist that conda rewrites to hold the
+    prefix it is linked into, as its extracted package lists them in info/paths.json or
+    info/has_prefix."""
+    for pkgs_dir in pkgs_dirs:
+        info_dir = join(pkgs_dir, _dist_name(dist), 'info')
+        if not os.path.isdir(info_dir):
+            continue
+        paths_json = join(info_dir, 'paths.json')
+        if os.path.isfile(paths_json):
+            with open(paths_json) as f:
+                paths = json.load(f).get('paths', [])
+            return {path['_path']: path.get('file_mode', 'text') for path in paths
+                    if path.get('prefix_placeholder')}
+        has_prefix = {}
+        if os.path.isfile(join(info_dir, 'has_prefix')):
+            with open(join(info_dir, 'has_prefix')) as f:
+                for line in f:
+                    # either "path", or "placeholder mode path"
+                    parts = [part.strip('"\'') for part in shlex.split(line, posix=False)]
+                    if len(parts) == 1:
+                        has_prefix[parts[0]] = 'text'
+                    elif len(parts) == 3:
+                        has_prefix[parts[2]] = parts[1]
+        return has_prefix
+    return {}
+
+
+def _prefix_mode(path, prefix_bytes):
+    """Returns 'binary' or 'text' if the file at path contains prefix_bytes (by whether it has
+    null bytes), or None if it doesn't.  The file is mapped rather than read, so that large
+    files don't have to fit in memory."""
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # empty, or can't be mapped
+            return None
+        try:
+            if mm.find(prefix_bytes) == -1:
+                return None
+            return 'binary' if mm.find(b'\x00') != -1 else 'text'
+        finally:
+            mm.close()
+
+
+def _find_files_with_prefix(prefix):
+    """Returns [path, mode] for each file under prefix (path relative to it) that contains
+    prefix, where mode is 'binary' for files with null bytes and 'text' otherwise.
+
+    Files that the linked packages list as holding their prefix are taken from the package
+    cache's metadata.  Of the rest, only files that were not hard linked from the package cache
+    are searched, as the package cache never holds this prefix; that leaves files that were
+    made at link time, like entry points and files written by post-link scripts.  Compiled
+    python files are left out, as they are when packaging."""
+    found = {}
+    for dist in linked(prefix):
+        for path, mode in _package_has_prefix(dist).items():
+            if os.path.isfile(join(prefix, path)):
+                found[os.path.normpath(path)] = mode
+    prefix_bytes = prefix.encode(utils.codec)
+    for root, _, files in os.walk(prefix):
+        for fn in files:
+            path = join(root, fn)
+            rel_path = os.path.relpath(path, prefix)
+            if (rel_path in found or fn.endswith(('.pyc', '.pyo')) or os.path.islink(path) or
+                    os.lstat(path).st_nlink > 1):
+                continue
+            mode = _prefix_mode(path, prefix_bytes)
+            if mode:
+                found[rel_path] = mode
+    return sorted([path, mode] for path, mode in found.items())
+
+
+def _binary_replace(data, old_prefix, new_prefix):
+    """Replaces old_prefix with new_prefix in the null-terminated strings of data, padding them
+    with nulls so that the size of data doesn't change.  new_prefix must not be longer."""
+    def replace(match):
+        occurrences = match.group().count(old_prefix)
+        padding = (len(old_prefix) - len(new_prefix)) * occurrences
+        return match.group().replace(old_prefix, new_prefix) + b'\x00' * padding
+    pattern = re.compile(re.escape(old_prefix) + b'([^\x00]*?)\x00')
+    return pattern.sub(replace, data)
+
+
+def _save_env_template(key, prefix, config):
+    """Stores the newly created environment in prefix as the template for key.  Files that
+    contain prefix are copied, and recorded so that clones only need to rewrite those.  Files
+    that aren't shared with the package cache are copied, and recorded so that clones copy them
+    too, except for compiled python files.  Everything else is hard linked, as conda links it
+    from the package cache."""
+    templates_dir = config.env_templates_dir
+    template_dir = join(templates_dir, key)
+    if os.path.isdir(template_dir):
+        return
+    tmp_dir = tempfile.mkdtemp(dir=templates_dir, suffix='.tmp')
+    template_prefix = join(tmp_dir, 'prefix')
+    try:
+        has_prefix = _find_files_with_prefix(prefix)
+        has_prefix_paths = set(path for path, _ in has_prefix)
+        copied = []
+        for root, dirs, files in os.walk(prefix):
+            rel_root = os.path.relpath(root, prefix)
+            os.makedirs(os.path.normpath(join(template_prefix, rel_root)))
+            # symlinks to directories are not walked into, and are recreated like other links
+            for fn in files + [d for d in dirs if os.path.islink(join(root, d))]:
+                src = join(root, fn)
+                dst = os.path.normpath(join(template_prefix, rel_root, fn))
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), dst)
+                elif fn.endswith(('.pyc', '.pyo')) and os.lstat(src).st_nlink == 1:
+                    # compiled when linking, so it refers to prefix, and can't be rewritten.
+                    #    Clones compile it again when it's imported.
+                    continue
+                elif os.path.normpath(join(rel_root, fn)) in has_prefix_paths:
+                    shutil.copy2(src, dst)
+                elif os.lstat(src).st_nlink == 1:
+                    # not shared with the package cache, so the build could change it
+                    shutil.copy2(src, dst)
+                    copied.append(os.path.normpath(join(rel_root, fn)))
+                else:
+                    os.link(src, dst)
+        with open(join(tmp_dir, 'template.json'), 'w') as f:
+            json.dump({'prefix': prefix, 'has_prefix': has_prefix, 'copied': sorted(copied)}, f)
+        os.rename(tmp_dir, template_dir)
+    except (OSError, IOError) as e:
+        # another process got there first, or the filesystem doesn't support hard links
+        utils.get_logger(__name__).debug("Not saving environment template: %s", e)
+    finally:
+        if os.path.isdir(tmp_dir):
+            utils.rm_rf(tmp_dir)
+
+    templates = sorted((join(templates_dir, fn) for fn in os.listdir(templates_dir)
+                        if not fn.endswith('.tmp')), key=os.path.getmtime)
+    for old_template in templates[:max(0, len(templates) - config.env_templates_max)]:
+        utils.rm_rf(old_template)
+
+
+def _clone_env_template(key, prefix, config):
+    """Creates the environment in prefix by cloning the template for key.  Returns False if
+    there is no such template, or it can't be cloned to prefix."""
+    template_dir = join(config.env_templates_dir, key)
+    try:
+        with open(join(template_dir, 'template.json')) as f:
+            template = json.load(f)
+    except (OSError, IOError, ValueError):
+        return False
+    if 'copied' not in template:
+        # from an older conda-build, which hard linked files that clones must copy
+        return False
+    copied = set(template['copied'])
+    old_prefix = template['prefix'].encode(utils.codec)
+    new_prefix = prefix.encode(utils.codec)
+    rewrite = dict(template['has_prefix'])
+    if 'binary' in rewrite.values() and len(new_prefix) > len(old_prefix):
+        # binary files can only take a prefix that fits in place of the old one
+        return False
+
+    template_prefix = join(template_dir, 'prefix')
+    try:
+        for root, dirs, files in os.walk(template_prefix):
+            rel_root = os.path.relpath(root, template_prefix)
+            dst_root = os.path.normpath(join(prefix, rel_root))
+            if not os.path.isdir(dst_root):
+                os.makedirs(dst_root)
+            for fn in files + [d for d in dirs if os.path.islink(join(root, d))]:
+                src = join(root, fn)
+                dst = join(dst_root, fn)
+                rel_path = os.path.normpath(join(rel_root, fn))
+                if os.path.islink(src):
+                    target = os.readlink(src)
+                    if target.startswith(template['prefix']):
+                        target = prefix + target[len(template['prefix']):]
+                    os.symlink(target, dst)
+                elif rel_path in rewrite:
+                    with open(src, 'rb') as f:
+                        data = f.read()
+                    if rewrite[rel_path] == 'binary':
+                        data = _binary_replace(data, old_prefix, new_prefix)
+                    else:
+                        data = data.replace(old_prefix, new_prefix)
+                    with open(dst, 'wb') as f:
+                        f.write(data)
+                    shutil.copymode(src, dst)
+                elif rel_path in copied:
+                    # a clone must not share it with the template, since it could be changed
+                    shutil.copy2(src, dst)
+                else:
+                    try:
+                        os.link(src, dst)
+                    except OSError:
+                        # e.g. prefix is on another filesystem
+                        shutil.copy2(src, dst)
+        # this is what eviction goes by
+        os.utime(template_dir, None)
+    except (OSError, IOError) as e:
+        utils.get_logger(__name__).debug("Could not clone environment template: %s", e)
+        utils.rm_rf(prefix)
+        return False
+    return True
+
+
 def create_env(prefix, specs_or_actions, config, subdir, clear_cache=True, retry=0,
-               locks=None):
+               locks=None, retry_on_error=True):
     '''
-    Create a conda envrionment for the given prefix and specs.
+    Create a conda envrionment for the given prefix and specs.  With retry_on_error=False, errors
+    are raised rather than retried.
     '''
     if config.debug:
         utils.get_logger("conda_build").setLevel(logging.DEBUG)
@@ -726,16 +1040,29 @@ def create_env(prefix, specs_or_actions, config, subdir, clear_cache=True, retry
                         if not hasattr(specs_or_actions, 'keys'):
                             specs = list(set(specs_or_actions))
                             actions = get_install_actions(prefix, index, specs, config,
-                                                          timestamp=index_ts)
+                                                          timestamp=index_ts, subdir=subdir)
                         else:
                             actions = specs_or_actions
-                        display_actions(actions, index)
-                        if utils.on_win:
-                            for k, v in os.environ.items():
-                                os.environ[k] = str(v)
-                        execute_actions(actions, index, verbose=config.debug)
+                        template_key = None
+                        # binary prefix replacement differs on windows, so templates are only
+                        #    used elsewhere
+                        if (config.env_templates and not utils.on_win and
+                                not (os.path.isdir(prefix) and os.listdir(prefix))):
+                            template_key = _env_template_key(actions, index, subdir)
+                        if template_key and _clone_env_template(template_key, prefix, config):
+                            log.debug("Cloned environment template into %s", prefix)
+                        else:
+                            display_actions(actions, index)
+                            if utils.on_win:
+                                for k, v in os.environ.items():
+                                    os.environ[k] = str(v)
+                            execute_actions(actions, index, verbose=config.debug)
+                            if template_key:
+                                _save_env_template(template_key, prefix, config)
                 except (SystemExit, PaddingError, LinkError, DependencyNeedsBuildingError,
                         CondaError) as exc:
+                    if not retry_on_error:
+                        raise
                     if (("too short in" in str(exc) or
                             re.search('post-link failed for: (?:[a-zA-Z]*::)?openssl', str(exc)) or
                             isinstance(exc, PaddingError)) and
@@ -789,6 +1116,8 @@ def create_env(prefix, specs_or_actions, config, subdir, clear_cache=True, retry
                 # HACK: some of the time, conda screws up somehow and incomplete packages result.
                 #    Just retry.
                 except (AssertionError, IOError, ValueError, RuntimeError, LockError) as exc:
+                    if not retry_on_error:
+                        raise
                     if isinstance(exc, AssertionError):
                         with utils.try_acquire_locks(locks, timeout=config.timeout):
                             pkg_dir = os.path.dirname(os.path.dirname(str(exc)))
@@ -812,6 +1141,69 @@ def create_env(prefix, specs_or_actions, config, subdir, clear_cache=True, retry
         symlink_conda(prefix, sys.prefix, shell)
 
 
+def prefix_file_stats(prefix):
+    """Returns {path: (size, mtime, inode)} for the files in prefix (paths relative to it), which
+    tells whether any of them have been changed or replaced since."""
+    stats = {}
+    for f in utils.prefix_files(prefix):
+        try:
+            st = os.lstat(join(prefix, f))
+        except OSError:
+            continue
+        stats[f] = (st.st_size, st.st_mtime, st.st_ino)
+    return stats
+
+
+def update_env(prefix, actions, config, subdir, baseline_files=None):
+    """Makes prefix the environment that actions (solved for an empty prefix) would create.
+
+    baseline_files is what prefix_file_stats returned for prefix right after it was last set up.
+    Files that have been added since are removed, and then only the packages that differ are
+    unlinked or linked.  Without baseline_files, or if any of them have gone missing or been
+    changed, prefix is wiped and created from scratch."""
+    log = utils.get_logger(__name__)
+    actions = copy.deepcopy(actions)
+    if 'PREFIX' in actions:
+        actions['PREFIX'] = prefix
+    current_files = prefix_file_stats(prefix) if os.path.isdir(prefix) else {}
+    if (baseline_files is None or not os.path.isdir(join(prefix, 'conda-meta')) or
+            any(current_files.get(f) != stat for f, stat in baseline_files.items())):
+        utils.rm_rf(prefix)
+        create_env(prefix, actions, config=config, subdir=subdir)
+        return
+
+    for f in set(current_files) - set(baseline_files):
+        path = join(prefix, f)
+        if os.path.isdir(path) and not os.path.islink(path):
+            utils.rm_rf(path)
+        elif os.path.lexists(path):
+            os.unlink(path)
+
+    # by the full dist string, so that a package from another channel counts as different
+    installed = {text_type(dist): dist for dist in linked(prefix)}
+    wanted = {text_type(dist): dist for dist in actions.get('LINK', [])}
+    if set(installed) == set(wanted):
+        log.debug("Keeping environment in %s, its packages are unchanged", prefix)
+        return
+
+    delta = copy.deepcopy(actions)
+    delta['UNLINK'] = [dist for key, dist in installed.items() if key not in wanted]
+    for op in ('LINK', 'FETCH', 'EXTRACT'):
+        if op in delta:
+            delta[op] = [dist for dist in delta[op] if text_type(dist) not in installed]
+    log.debug("Updating environment in %s: unlinking %s, linking %s", prefix,
+              delta['UNLINK'], delta.get('LINK'))
+    # create_env's retries (and its fallback to a shorter prefix) would reuse the actions they
+    #    are given, and the delta is only right for this env as it is.  So any failure starts
+    #    over with all of the actions.
+    try:
+        create_env(prefix, delta, config=config, subdir=subdir, retry_on_error=False)
+    except (Exception, SystemExit) as e:
+        log.debug("Updating environment in %s failed, creating it from scratch: %s", prefix, e)
+        utils.rm_rf(prefix)
+        create_env(prefix, actions, config=config, subdir=subdir)
+
+
 def clean_pkg_cache(dist, config):
     _pkgs_dirs = pkgs_dirs[:1]
     locks = []
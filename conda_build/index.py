@@ -4,23 +4,48 @@ Functions related to creating repodata index files.
 
 from __future__ import absolute_import, division, print_function
 
-import bz2
+from collections import OrderedDict
 import contextlib
 from functools import partial
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import tarfile
-from os.path import isfile, join, getmtime
+import threading
+from os.path import isfile, join, getmtime, getsize
 
+from conda_build.compression import get_compressor
 from conda_build.utils import file_info, get_lock, try_acquire_locks
 from conda_build import utils, conda_interface
-from .conda_interface import PY3, md5_file, url_path, CondaHTTPError, get_index
-
-local_index_timestamp = 0
-cached_index = None
-local_subdir = ""
-cached_channels = []
+from .conda_interface import PY3, url_path, CondaHTTPError, get_index
+
+# (platform, channel urls, omit_defaults, local channel): (index, timestamp), least recently used
+#    first.  Cross-compiling builds alternate between build_subdir and host_subdir, so more than
+#    one index is kept.
+_build_index_cache = OrderedDict()
+_BUILD_INDEX_CACHE_SIZE = 4
+# guards _build_index_cache and _build_index_locks.  Each key has its own (reentrant) lock, held
+#    while its index is fetched, so that threads wanting the same index don't all fetch it.
+_build_index_cache_lock = threading.Lock()
+_build_index_locks = {}
+# key of _build_index_cache: index_fingerprint of its index
+_build_index_fingerprints = {}
+
+
+def _read_index_json(tar_path):
+    with tarfile.open(tar_path) as t:
+        try:
+            return json.loads(t.extractfile('info/index.json').read().decode('utf-8'))
+        except EOFError:
+            raise RuntimeError("Could not extract %s. File probably corrupt."
+                % tar_path)
+        except OSError as e:
+            raise RuntimeError("Could not extract %s (%s)" % (tar_path, e))
+        except tarfile.ReadError:
+            raise RuntimeError("Could not extract metadata from %s. "
+                            "File probably corrupt." % tar_path)
 
 
 def read_index_tar(tar_path, config, lock):
@@ -29,17 +54,71 @@ def read_index_tar(tar_path, config, lock):
     if config.locking:
         locks = [lock]
     with try_acquire_locks(locks, config.timeout):
-        with tarfile.open(tar_path) as t:
-            try:
-                return json.loads(t.extractfile('info/index.json').read().decode('utf-8'))
-            except EOFError:
-                raise RuntimeError("Could not extract %s. File probably corrupt."
-                    % tar_path)
-            except OSError as e:
-                raise RuntimeError("Could not extract %s (%s)" % (tar_path, e))
-            except tarfile.ReadError:
-                raise RuntimeError("Could not extract metadata from %s. "
-                                "File probably corrupt." % tar_path)
+        return _read_index_json(tar_path)
+
+
+def _index_package(tar_path, digests=None):
+    """Returns the full index entry for a package: its index.json plus size, mtime and hashes.
+    The hashes are taken from digests if the caller already has them.  This runs in worker
+    processes, so the caller must hold any lock on the folder."""
+    d = _read_index_json(tar_path)
+    if digests:
+        d.update(digests)
+        d.update({'size': getsize(tar_path), 'mtime': getmtime(tar_path)})
+    else:
+        d.update(file_info(tar_path))
+    return d
+
+
+def _index_package_star(args):
+    # Pool.imap only passes a single argument
+    return _index_package(*args)
+
+
+def index_packages(paths, threads=1, digests=None):
+    """Yields (path, index entry) for each of paths, in order.  digests has the md5 and sha256
+    of any of the packages that have been hashed already (as file_digests returns them), which
+    aren't hashed again.  With threads > 1, packages are read and hashed in a pool of worker
+    processes.  Each worker streams through one package at a time and only sends back the
+    small index entry, so memory use stays bounded."""
+    digests = digests or {}
+    args = [(path, digests.get(path)) for path in paths]
+    if threads > 1 and len(args) > 1:
+        pool = multiprocessing.Pool(min(threads, len(args)))
+        try:
+            for (path, _), d in zip(args, pool.imap(_index_package_star, args)):
+                yield path, d
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for path, package_digests in args:
+            yield path, _index_package(path, package_digests)
+
+
+def iterencode_repodata(repodata, buffer_size=64 * 1024):
+    """Yields the text of repodata.json in pieces of about buffer_size characters.
+
+    Joined together, the pieces are the same as pretty-printing all of repodata with json.dumps
+    and stripping trailing whitespace from each line, but without ever holding the whole text
+    in memory."""
+    encoder = json.JSONEncoder(indent=2, sort_keys=True)
+    out, out_size, line = [], 0, ''
+    for chunk in encoder.iterencode(repodata):
+        line += chunk
+        if '\n' in line:
+            lines = line.split('\n')
+            line = lines.pop()
+            for complete_line in lines:
+                # strip trailing whitespace
+                out.append(complete_line.rstrip() + '\n')
+                out_size += len(out[-1])
+            if out_size >= buffer_size:
+                yield ''.join(out)
+                out, out_size = [], 0
+    # make sure we have newline at the end
+    out.append(line.rstrip() + '\n')
+    yield ''.join(out)
 
 
 def write_repodata(repodata, dir_path, lock, config=None):
@@ -51,20 +130,110 @@ def write_repodata(repodata, dir_path, lock, config=None):
     if config.locking:
         locks = [lock]
     with try_acquire_locks(locks, config.timeout):
-        data = json.dumps(repodata, indent=2, sort_keys=True)
-        # strip trailing whitespace
-        data = '\n'.join(line.rstrip() for line in data.splitlines())
-        # make sure we have newline at the end
-        if not data.endswith('\n'):
-            data += '\n'
-        with open(join(dir_path, 'repodata.json'), 'w') as fo:
-            fo.write(data)
-        with open(join(dir_path, 'repodata.json.bz2'), 'wb') as fo:
-            fo.write(bz2.compress(data.encode('utf-8')))
+        # written to temporary files first, and only put in place once both are complete, so
+        #    that a failure or interruption halfway doesn't leave a truncated index behind
+        paths = [join(dir_path, fn) for fn in ('repodata.json', 'repodata.json.bz2')]
+        tmp_paths = [join(dir_path, '.{}.tmp'.format(os.path.basename(path))) for path in paths]
+        try:
+            with open(tmp_paths[0], 'w') as fo:
+                with open(tmp_paths[1], 'wb') as fo_bz2:
+                    with get_compressor(fo_bz2, 'bz2', threads=config.threads) as compressor:
+                        for data in iterencode_repodata(repodata):
+                            fo.write(data)
+                            compressor.write(data.encode('utf-8'))
+            for tmp_path, path in zip(tmp_paths, paths):
+                if utils.on_win and isfile(path):
+                    # os.rename won't replace an existing file on windows
+                    os.unlink(path)
+                os.rename(tmp_path, path)
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.lexists(tmp_path):
+                    os.unlink(tmp_path)
+
+
+# Incremental updates append their new index entries here, one json object per line, instead
+#    of rewriting .index.json.  A full update folds the journal back into .index.json.
+INDEX_JOURNAL = '.index.json.journal'
+# past this size, incremental updates fall back to a full update to compact the journal
+INDEX_JOURNAL_MAX_SIZE = 10 * 1024 * 1024
+
+
+def _read_index_journal(journal_path, index):
+    """Apply the entries from incremental updates in journal_path on top of index."""
+    mode_dict = {'mode': 'r', 'encoding': 'utf-8'} if PY3 else {'mode': 'rb'}
+    try:
+        with open(journal_path, **mode_dict) as fi:
+            for line in fi:
+                try:
+                    entries = json.loads(line)
+                except ValueError:
+                    # partially written line from an interrupted update
+                    continue
+                for fn, info in entries.items():
+                    if info is None:
+                        index.pop(fn, None)
+                    else:
+                        index[fn] = info
+    except IOError:
+        pass
+    return index
+
+
+def _repodata_record(info):
+    """Returns the repodata.json record for an .index.json entry"""
+    info = info.copy()
+    for varname in 'arch', 'platform', 'mtime', 'ucs':
+        info.pop(varname, None)
+    if 'requires' in info and 'depends' not in info:
+        info['depends'] = info['requires']
+    return info
+
+
+def _update_index_incremental(dir_path, filenames, config, lock):
+    """Index only filenames, by patching the existing repodata.json and appending their entries
+    to the index journal.  Nothing else in dir_path is listed or stat'ed.
+
+    Returns False without changing anything if there is no usable repodata.json to patch, or
+    the journal has grown too large, in which case a full update is needed."""
+    journal_path = join(dir_path, INDEX_JOURNAL)
+    if isfile(journal_path) and os.path.getsize(journal_path) > INDEX_JOURNAL_MAX_SIZE:
+        return False
+    mode_dict = {'mode': 'r', 'encoding': 'utf-8'} if PY3 else {'mode': 'rb'}
+    try:
+        with open(join(dir_path, 'repodata.json'), **mode_dict) as fi:
+            repodata = json.load(fi)
+        packages = repodata['packages']
+    except (IOError, ValueError, KeyError, TypeError):
+        return False
+
+    entries = {}
+    for fn in filenames:
+        path = join(dir_path, fn)
+        if isfile(path):
+            if config.verbose:
+                print('updating:', fn)
+            d = read_index_tar(path, config, lock=lock)
+            d.update(file_info(path))
+            d['sig'] = '.' if isfile(path + '.sig') else None
+            entries[fn] = d
+            packages[fn] = _repodata_record(d)
+        else:
+            if config.verbose:
+                print("removing:", fn)
+            entries[fn] = None
+            packages.pop(fn, None)
+
+    if entries:
+        mode_dict = {'mode': 'a', 'encoding': 'utf-8'} if PY3 else {'mode': 'ab'}
+        with open(journal_path, **mode_dict) as fo:
+            fo.write(json.dumps(entries, sort_keys=True, default=str) + '\n')
+        write_repodata(repodata, dir_path, lock=lock, config=config)
+    return True
 
 
 def update_index(dir_path, config, force=False, check_md5=False, remove=True, lock=None,
-                 could_be_mirror=True):
+                 could_be_mirror=True, filenames=None):
     """
     Update all index files in dir_path with changed packages.
 
@@ -76,6 +245,10 @@ def update_index(dir_path, config, force=False, check_md5=False, remove=True, lo
     :param check_md5: Whether to check MD5s instead of mtimes for determining
                       if a package changed.
     :type check_md5: bool
+    :param filenames: If given, only these packages (file names within dir_path) have
+                      changed.  The existing repodata is patched with them rather than
+                      re-indexing the whole folder.  Ignored when force is set.
+    :type filenames: list of str
     """
 
     log = utils.get_logger(__name__)
@@ -93,9 +266,14 @@ def update_index(dir_path, config, force=False, check_md5=False, remove=True, lo
     if config.locking:
         locks.append(lock)
 
+    journal_path = join(dir_path, INDEX_JOURNAL)
     index = {}
 
     with try_acquire_locks(locks, config.timeout):
+        if filenames is not None and not force:
+            if _update_index_incremental(dir_path, filenames, config, lock):
+                return
+
         if not force:
             try:
                 mode_dict = {'mode': 'r', 'encoding': 'utf-8'} if PY3 else {'mode': 'rb'}
@@ -103,22 +281,28 @@ def update_index(dir_path, config, force=False, check_md5=False, remove=True, lo
                     index = json.load(fi)
             except (IOError, ValueError):
                 index = {}
+            _read_index_journal(journal_path, index)
 
         subdir = None
 
         files = set(fn for fn in os.listdir(dir_path) if fn.endswith('.tar.bz2'))
-        for fn in files:
+        changed = []
+        # packages hashed to check their md5, which don't need to be hashed again
+        digests = {}
+        for fn in sorted(files):
             path = join(dir_path, fn)
             if fn in index:
                 if check_md5:
-                    if index[fn]['md5'] == md5_file(path):
+                    digests[path] = utils.file_digests(path)
+                    if index[fn]['md5'] == digests[path]['md5']:
                         continue
                 elif index[fn]['mtime'] == getmtime(path):
                     continue
+            changed.append(path)
+        for path, d in index_packages(changed, threads=config.threads, digests=digests):
+            fn = os.path.basename(path)
             if config.verbose:
                 print('updating:', fn)
-            d = read_index_tar(path, config, lock=lock)
-            d.update(file_info(path))
             index[fn] = d
             # there's only one subdir for a given folder, so only read these contents once
             if not subdir:
@@ -138,20 +322,13 @@ def update_index(dir_path, config, force=False, check_md5=False, remove=True, lo
         mode_dict = {'mode': 'w', 'encoding': 'utf-8'} if PY3 else {'mode': 'wb'}
         with open(index_path, **mode_dict) as fo:
             json.dump(index, fo, indent=2, sort_keys=True, default=str)
+        # everything in the journal is in .index.json now
+        if os.path.isfile(journal_path):
+            os.remove(journal_path)
 
         # --- new repodata
-        for fn in index:
-            info = index[fn]
-            for varname in 'arch', 'platform', 'mtime', 'ucs':
-                try:
-                    del info[varname]
-                except KeyError:
-                    pass
-
-            if 'requires' in info and 'depends' not in info:
-                info['depends'] = info['requires']
-
-        repodata = {'packages': index, 'info': {}}
+        packages = {fn: _repodata_record(info) for fn, info in index.items()}
+        repodata = {'packages': packages, 'info': {}}
         write_repodata(repodata, dir_path, lock=lock, config=config)
         # subdir_index = CURRENT_INDEX.get(subdir, {})
         # subdir_index.update(index)
@@ -166,71 +343,186 @@ def ensure_valid_channel(local_folder, subdir, config):
             update_index(path, config)
 
 
+# fields of index records that, besides their dist, change what a solve with them comes up with
+_FINGERPRINT_FIELDS = ('md5', 'depends', 'constrains', 'features', 'track_features')
+
+
+def index_fingerprint(index):
+    """Returns a digest of the packages in index.  Records are identified by their md5 and
+    dependencies as well as their dist, as a package can be rebuilt, or its record patched,
+    without its name changing.  Fingerprints of the indexes in the build index cache are kept
+    with them, and computed only once."""
+    with _build_index_cache_lock:
+        key = next((key for key, (cached_index, _) in _build_index_cache.items()
+                    if cached_index is index), None)
+        if key in _build_index_fingerprints:
+            return _build_index_fingerprints[key]
+    hash_ = hashlib.sha256()
+    for dist, record in sorted(index.items(), key=lambda item: str(item[0])):
+        fields = [record.get(field) for field in _FINGERPRINT_FIELDS]
+        hash_.update(json.dumps([str(dist), fields], default=repr).encode('utf-8'))
+    fingerprint = hash_.hexdigest()
+    if key is not None:
+        with _build_index_cache_lock:
+            # unless the index has been replaced in the meantime
+            if _build_index_cache.get(key, (None, ))[0] is index:
+                _build_index_fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def _local_channel(config):
+    """The folder that built packages go to, which is the first channel of the build index"""
+    if config.output_folder:
+        return config.output_folder
+    return os.path.dirname(config.bldpkgs_dir)
+
+
+@contextlib.contextmanager
+def _quiet_index_fetch(config):
+    """Silences output from conda about fetching index files, unless config is verbose"""
+    capture = contextlib.contextmanager(lambda: (yield))
+    if config.debug:
+        log_context = partial(utils.LoggingContext, logging.DEBUG)
+    elif config.verbose:
+        log_context = partial(utils.LoggingContext, logging.INFO)
+    else:
+        log_context = partial(utils.LoggingContext, logging.CRITICAL + 1)
+        capture = utils.capture
+    with log_context():
+        with capture():
+            yield
+
+
+def _build_index_key(config, subdir, omit_defaults):
+    # noarch packages are installed from an index of the native subdir, which has both
+    platform = conda_interface.subdir if subdir == 'noarch' else subdir
+    return platform, tuple(config.channel_urls), omit_defaults, _local_channel(config)
+
+
+def _local_index_timestamp(output_folder, platform):
+    """The age of the local channel's part of an index for platform, which has both the platform's
+    and the noarch packages"""
+    mtimes = [0]
+    for folder in (platform, 'noarch'):
+        index_file = os.path.join(output_folder, folder, 'repodata.json')
+        if os.path.isfile(index_file):
+            mtimes.append(os.path.getmtime(index_file))
+    return max(mtimes)
+
+
+def _cached_build_index(key, timestamp=None):
+    """The cached (index, timestamp) for key, if it isn't older than timestamp"""
+    with _build_index_cache_lock:
+        cached = _build_index_cache.get(key)
+        if cached is None or (timestamp is not None and timestamp > cached[1]):
+            return None
+        # most recently used is last
+        del _build_index_cache[key]
+        _build_index_cache[key] = cached
+        return cached
+
+
+def _cache_build_index(key, index, timestamp):
+    with _build_index_cache_lock:
+        _build_index_cache.pop(key, None)
+        _build_index_fingerprints.pop(key, None)
+        _build_index_cache[key] = (index, timestamp)
+        while len(_build_index_cache) > _BUILD_INDEX_CACHE_SIZE:
+            old_key, _ = _build_index_cache.popitem(last=False)
+            _build_index_fingerprints.pop(old_key, None)
+
+
+def _build_index_lock(key):
+    with _build_index_cache_lock:
+        return _build_index_locks.setdefault(key, threading.RLock())
+
+
+def clear_build_index_cache():
+    with _build_index_cache_lock:
+        _build_index_cache.clear()
+        _build_index_fingerprints.clear()
+
+
 def get_build_index(config, subdir, clear_cache=False, omit_defaults=False):
-    global local_index_timestamp
-    global local_subdir
-    global cached_index
-    global cached_channels
+    """Returns the index of packages available to builds for subdir, and its timestamp.  Indexes
+    are cached for several subdirs and channel settings; one is fetched again when the local
+    channel has been indexed since it was cached."""
     log = utils.get_logger(__name__)
-    mtime = 0
+    output_folder = _local_channel(config)
+    key = _build_index_key(config, subdir, omit_defaults)
+    platform = key[0]
+
+    with _build_index_lock(key):
+        # check file modification time - this is the age of our index.
+        timestamp = _local_index_timestamp(output_folder, platform)
+        cached = None
+        if not clear_cache and os.path.isfile(os.path.join(output_folder, subdir,
+                                                           'repodata.json')):
+            cached = _cached_build_index(key, timestamp)
+        if cached:
+            return cached
 
-    if config.output_folder:
-        output_folder = config.output_folder
-    else:
-        output_folder = os.path.dirname(config.bldpkgs_dir)
-
-    # check file modification time - this is the age of our index.
-    index_file = os.path.join(output_folder, subdir, 'repodata.json')
-    if os.path.isfile(index_file):
-        mtime = os.path.getmtime(index_file)
-
-    if (clear_cache or
-            not os.path.isfile(index_file) or
-            local_subdir != subdir or
-            mtime > local_index_timestamp or
-            cached_channels != config.channel_urls):
         log.debug("Building new index for subdir '{}' with channels {}, condarc channels "
                   "= {}".format(subdir, config.channel_urls, not omit_defaults))
         # priority: local by croot (can vary), then channels passed as args,
         #     then channels from config.
-        capture = contextlib.contextmanager(lambda: (yield))
-        if config.debug:
-            log_context = partial(utils.LoggingContext, logging.DEBUG)
-        elif config.verbose:
-            log_context = partial(utils.LoggingContext, logging.INFO)
-        else:
-            log_context = partial(utils.LoggingContext, logging.CRITICAL + 1)
-            capture = utils.capture
-
         urls = list(config.channel_urls)
         if os.path.isdir(output_folder):
             urls.insert(0, url_path(output_folder))
         ensure_valid_channel(output_folder, subdir, config)
+        # the channel may have just been created
+        timestamp = _local_index_timestamp(output_folder, platform)
 
         # silence output from conda about fetching index files
-        with log_context():
-            with capture():
-                # replace noarch with native subdir - this ends up building an index with both the
-                #      native content and the noarch content.
-                if subdir == 'noarch':
-                    subdir = conda_interface.subdir
-                try:
-                    cached_index = get_index(channel_urls=urls,
-                                    prepend=not omit_defaults,
+        with _quiet_index_fetch(config):
+            try:
+                index = get_index(channel_urls=urls,
+                                  prepend=not omit_defaults,
+                                  use_local=False,
+                                  use_cache=False,
+                                  platform=platform)
+            # HACK: defaults does not have the many subfolders we support.  Omit it and
+            #          try again.
+            except CondaHTTPError:
+                if 'defaults' in urls:
+                    urls.remove('defaults')
+                index = get_index(channel_urls=urls,
+                                  prepend=omit_defaults,
+                                  use_local=False,
+                                  use_cache=False,
+                                  platform=platform)
+        _cache_build_index(key, index, timestamp)
+    return index, timestamp
+
+
+def update_build_index(config, subdir, omit_defaults=False):
+    """Adds the packages that have been built (and indexed) in the local channel since the build
+    index was cached to it, for packages built for subdir.  Only the local channel is read
+    again; the other channels' repodata is never refetched for this.
+
+    Returns the index and its timestamp, as get_build_index does.  If no index is cached for
+    subdir's platform and the current channels, this is the same as get_build_index."""
+    output_folder = _local_channel(config)
+    key = _build_index_key(config, subdir, omit_defaults)
+    platform = key[0]
+    with _build_index_lock(key):
+        cached = _cached_build_index(key)
+        if not cached or not os.path.isfile(os.path.join(output_folder, subdir,
+                                                         'repodata.json')):
+            return get_build_index(config, subdir, omit_defaults=omit_defaults)
+
+        utils.get_logger(__name__).debug("Adding new local packages to the index for subdir "
+                                         "'{}'".format(platform))
+        timestamp = _local_index_timestamp(output_folder, platform)
+        with _quiet_index_fetch(config):
+            # the local channel comes first in the full index, too, so its records are the same
+            local_index = get_index(channel_urls=[url_path(output_folder)],
+                                    prepend=False,
                                     use_local=False,
                                     use_cache=False,
-                                    platform=subdir)
-                # HACK: defaults does not have the many subfolders we support.  Omit it and
-                #          try again.
-                except CondaHTTPError:
-                    if 'defaults' in urls:
-                        urls.remove('defaults')
-                    cached_index = get_index(channel_urls=urls,
-                                             prepend=omit_defaults,
-                                             use_local=False,
-                                             use_cache=False,
-                                             platform=subdir)
-        local_index_timestamp = mtime
-        local_subdir = subdir
-        cached_channels = config.channel_urls
-    return cached_index, local_index_timestamp
+                                    platform=platform)
+        # a new dict, as other threads may be using the cached one
+        index = cached[0].copy()
+        index.update(local_index)
+        _cache_build_index(key, index, timestamp)
+    return index, timestamp
@@ -73,7 +73,34 @@ class FilteredLoader(jinja2.BaseLoader):
         from .metadata import select_lines, ns_cfg
         contents, filename, uptodate = self._unfiltered_loader.get_source(environment,
                                                                           template)
-        return select_lines(contents, ns_cfg(self.config)), filename, uptodate
+        selected = select_lines(contents, ns_cfg(self.config))
+
+        def selected_uptodate():
+            # environments are reused with other configs, so a compiled template is only up to
+            #    date if the selectors for the current config pick out the same lines
+            return ((uptodate is None or uptodate()) and
+                    select_lines(contents, ns_cfg(self.config)) == selected)
+
+        return selected, filename, selected_uptodate
+
+
+class MemoryBytecodeCache(jinja2.BytecodeCache):
+    """
+    Keeps compiled templates in memory, keyed by template name and source.
+
+    jinja's own template cache holds only one compiled template per name, which is replaced
+    whenever selectors pick out different lines for a new config.  This lets environments that
+    are reused across variants switch between those without compiling them again.
+    """
+
+    def __init__(self):
+        self._code = {}
+
+    def load_bytecode(self, bucket):
+        bucket.code = self._code.get((bucket.key, bucket.checksum))
+
+    def dump_bytecode(self, bucket):
+        self._code[(bucket.key, bucket.checksum)] = bucket.code
 
 
 def load_setup_py_data(config, setup_file='setup.py', from_recipe_dir=False, recipe_dir=None,
@@ -447,8 +474,19 @@ def get_used_variants(recipe_metadata):
     actually used."""
     with open(recipe_metadata.meta_path) as f:
         recipe_text = f.read()
-    used_variables = set()
+    # the language versions go into the selector namespace and build strings, and the others
+    #    change how requirements are pinned and hashed
+    used_variables = set(['python', 'numpy', 'perl', 'lua', 'r_base', 'target_platform',
+                          'ignore_version', 'pin_run_as_build', 'zip_keys', 'extend_keys'])
     for lang in 'c', 'cxx', 'fortran':
         if re.search('compiler\([\\]?[\'"]{}[\\]?[\'"]\)'.format(lang), recipe_text):
             used_variables.update(set(['{}_compiler'.format(lang), 'target_platform']))
+    # variant values are available as jinja variables (and in environ) by name, and pin build
+    #    dependencies of the same name, so any key that is mentioned in the recipe may be used
+    config = recipe_metadata.config
+    for variant in getattr(config, 'variants', None) or [config.variant]:
+        for key in variant:
+            if key not in used_variables and re.search(r'\b{}\b'.format(re.escape(key)),
+                                                       recipe_text):
+                used_variables.add(key)
     return used_variables
@@ -46,55 +46,87 @@ ARCH_MAP = {'32': 'x86',
             '64': 'x86_64'}
 
 
+# (build subdir, python, numpy, perl and lua versions): the part of the selector namespace that
+#    doesn't depend on the environment
+_ns_cfg_cache = {}
+# (key of _ns_cfg_cache, environment variables): the whole namespace
+_ns_cfg_env_cache = utils.LRUCache(maxsize=32)
+
+
+class _SharedNamespace(dict):
+    """A dict that can't be changed, as it is handed to every caller that asks for it"""
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("this namespace is shared, and can't be changed.  Change a copy of it.")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+
 def ns_cfg(config):
     # Remember to update the docs of any of this changes
     plat = config.build_subdir
-    d = dict(
-        linux=plat.startswith('linux-'),
-        linux32=bool(plat == 'linux-32'),
-        linux64=bool(plat == 'linux-64'),
-        arm=plat.startswith('linux-arm'),
-        osx=plat.startswith('osx-'),
-        unix=plat.startswith(('linux-', 'osx-')),
-        win=plat.startswith('win-'),
-        win32=bool(plat == 'win-32'),
-        win64=bool(plat == 'win-64'),
-        x86=plat.endswith(('-32', '-64')),
-        x86_64=plat.endswith('-64'),
-        os=os,
-        environ=os.environ,
-        nomkl=bool(int(os.environ.get('FEATURE_NOMKL', False)))
-    )
-
-    py = config.variant.get('python', get_default_variants()[0]['python'])
-    py = int("".join(py.split('.')[:2]))
-    d.update(dict(py=py,
-                    py3k=bool(30 <= py < 40),
-                    py2k=bool(20 <= py < 30),
-                    py26=bool(py == 26),
-                    py27=bool(py == 27),
-                    py33=bool(py == 33),
-                    py34=bool(py == 34),
-                    py35=bool(py == 35),
-                    py36=bool(py == 36),))
-
-    np = config.variant.get('numpy', get_default_variants()[0]['numpy'])
-    d['np'] = int("".join(np.split('.')[:2]))
-
-    pl = config.variant.get('perl', get_default_variants()[0]['perl'])
-    d['pl'] = pl
-
-    lua = config.variant.get('lua', get_default_variants()[0]['lua'])
-    d['lua'] = lua
-    d['luajit'] = bool(lua[0] == "2")
-
-    for machine in non_x86_linux_machines:
-        d[machine] = bool(plat == 'linux-%s' % machine)
-
-    for feature, value in feature_list:
-        d[feature] = value
-    d.update(os.environ)
-    return d
+    variant = config.variant
+    if not all(name in variant for name in ('python', 'numpy', 'perl', 'lua')):
+        default = get_default_variants()[0]
+        variant = dict((name, variant.get(name, default[name]))
+                       for name in ('python', 'numpy', 'perl', 'lua'))
+    key = (plat, variant['python'], variant['numpy'], variant['perl'], variant['lua'])
+    if key not in _ns_cfg_cache:
+        d = dict(
+            linux=plat.startswith('linux-'),
+            linux32=bool(plat == 'linux-32'),
+            linux64=bool(plat == 'linux-64'),
+            arm=plat.startswith('linux-arm'),
+            osx=plat.startswith('osx-'),
+            unix=plat.startswith(('linux-', 'osx-')),
+            win=plat.startswith('win-'),
+            win32=bool(plat == 'win-32'),
+            win64=bool(plat == 'win-64'),
+            x86=plat.endswith(('-32', '-64')),
+            x86_64=plat.endswith('-64'),
+            os=os,
+        )
+
+        py = variant['python']
+        py = int("".join(py.split('.')[:2]))
+        d.update(dict(py=py,
+                        py3k=bool(30 <= py < 40),
+                        py2k=bool(20 <= py < 30),
+                        py26=bool(py == 26),
+                        py27=bool(py == 27),
+                        py33=bool(py == 33),
+                        py34=bool(py == 34),
+                        py35=bool(py == 35),
+                        py36=bool(py == 36),))
+
+        np = variant['numpy']
+        d['np'] = int("".join(np.split('.')[:2]))
+
+        pl = variant['perl']
+        d['pl'] = pl
+
+        lua = variant['lua']
+        d['lua'] = lua
+        d['luajit'] = bool(lua[0] == "2")
+
+        for machine in non_x86_linux_machines:
+            d[machine] = bool(plat == 'linux-%s' % machine)
+
+        for feature, value in feature_list:
+            d[feature] = value
+        _ns_cfg_cache[key] = d
+
+    # the environment can change between calls, so the whole namespace is cached for each
+    #    environment it has been asked for with
+    env_key = (key, frozenset(os.environ.items()))
+    if env_key not in _ns_cfg_env_cache:
+        d = _ns_cfg_cache[key].copy()
+        d['environ'] = os.environ
+        if 'nomkl' not in d:
+            # a nomkl feature in feature_list takes precedence
+            d['nomkl'] = bool(int(os.environ.get('FEATURE_NOMKL', False)))
+        d.update(os.environ)
+        _ns_cfg_env_cache[env_key] = _SharedNamespace(d)
+    return _ns_cfg_env_cache[env_key]
 
 
 # Selectors must be either:
@@ -119,6 +151,21 @@ def parseNameNotFound(error):
         return ""
 
 
+# selector string: compiled code object.  The same few selectors are evaluated for every line
+#    they appear on, for every parse of every variant.
+_selector_code = utils.LRUCache(maxsize=1024)
+
+
+def _compile_selector(selector_string):
+    if selector_string not in _selector_code:
+        _selector_code[selector_string] = compile(selector_string, '<selector>', 'eval')
+    return _selector_code[selector_string]
+
+
+# eval adds __builtins__ to the globals it is given, so the (shared) namespace is passed as locals
+_selector_globals = {}
+
+
 # We evaluate the selector and return True (keep this line) or False (drop this line)
 # If we encounter a NameError (unknown variable in selector), then we replace it by False and
 #     re-run the evaluation
@@ -126,7 +173,11 @@ def eval_selector(selector_string, namespace):
     try:
         # TODO: is there a way to do this without eval?  Eval allows arbitrary
         #    code execution.
-        return eval(selector_string, namespace, {})
+        try:
+            return eval(_compile_selector(selector_string), _selector_globals, namespace)
+        except NameError:
+            # names in comprehensions and lambdas are only looked up in globals
+            return eval(_compile_selector(selector_string), dict(namespace), {})
     except NameError as e:
         missing_var = parseNameNotFound(e)
         print("Warning: Treating unknown selector \'" + missing_var + "\' as if it was False.")
@@ -134,32 +185,53 @@ def eval_selector(selector_string, namespace):
         return eval_selector(next_string, namespace)
 
 
-def select_lines(data, namespace):
-    lines = []
+# meta.yaml text: list of (line number, original line, line to keep, selector or None).  The
+#    lines only need to be split up and matched against sel_pat once, no matter how many
+#    namespaces they are selected for.
+_selector_lines = utils.LRUCache(maxsize=256)
+
+
+def _split_selector_lines(data):
+    if data not in _selector_lines:
+        lines = []
+        for i, line in enumerate(data.splitlines()):
+            line = line.rstrip()
 
-    for i, line in enumerate(data.splitlines()):
-        line = line.rstrip()
+            trailing_quote = ""
+            if line and line[-1] in ("'", '"'):
+                trailing_quote = line[-1]
 
-        trailing_quote = ""
-        if line and line[-1] in ("'", '"'):
-            trailing_quote = line[-1]
+            if line.lstrip().startswith('#'):
+                # Don't bother with comment only lines
+                continue
+            m = sel_pat.match(line)
+            if m:
+                lines.append((i, line, m.group(1) + trailing_quote, m.group(3)))
+            else:
+                lines.append((i, line, line, None))
+        _selector_lines[data] = lines
+    return _selector_lines[data]
+
+
+def select_lines(data, namespace):
+    lines = []
+    # many lines share the same selector
+    selected = {}
 
-        if line.lstrip().startswith('#'):
-            # Don't bother with comment only lines
+    for i, line, keep, cond in _split_selector_lines(data):
+        if cond is None:
+            lines.append(keep)
             continue
-        m = sel_pat.match(line)
-        if m:
-            cond = m.group(3)
+        if cond not in selected:
             try:
-                if eval_selector(cond, namespace):
-                    lines.append(m.group(1) + trailing_quote)
+                selected[cond] = eval_selector(cond, namespace)
             except:
                 sys.exit('''\
 Error: Invalid selector in meta.yaml line %d:
 %s
 ''' % (i + 1, line))
-        else:
-            lines.append(line)
+        if selected[cond]:
+            lines.append(keep)
     return '\n'.join(lines) + '\n'
 
 
@@ -221,8 +293,116 @@ def ensure_valid_noarch_value(meta):
         raise exceptions.CondaBuildException("Invalid value for noarch: %s" % build_noarch)
 
 
+class CopyOnWriteDict(dict):
+    """
+    A dict that shares its values with the copies made by its copy method, which only has to
+    copy the top level of the dict.
+
+    Callers are free to modify the values they get from it in place, so a shared value is deep
+    copied the first time it is looked up in either dict.  Values that are never looked up are
+    never copied.  For recipe metadata, the values are the sections of the recipe, and most
+    copies only touch a few of them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CopyOnWriteDict, self).__init__(*args, **kwargs)
+        self._shared = set()
+
+    def _unshare(self, key):
+        if key in self._shared:
+            self._shared.discard(key)
+            dict.__setitem__(self, key, copy.deepcopy(dict.__getitem__(self, key)))
+
+    def __getitem__(self, key):
+        self._unshare(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._unshare(key)
+        return dict.get(self, key, default)
+
+    def setdefault(self, key, default=None):
+        self._unshare(key)
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *args):
+        self._unshare(key)
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        if key in self._shared:
+            self._shared.discard(key)
+            value = copy.deepcopy(value)
+        return key, value
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        self._shared.clear()
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    # Overriding __iter__ keeps python 3 from copying this dict with dict(d), {**d} or
+    #    dict.update(d) by reading its storage directly, which would hand out shared values.  It
+    #    goes through keys and __getitem__ instead.  Python 2 always reads the storage directly,
+    #    so code in conda-build copies these dicts through items().
+    def __iter__(self):
+        return iter(dict.keys(self))
+
+    def keys(self):
+        return list(dict.keys(self))
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def copy(self):
+        # from here on, both dicts share all values
+        self._shared = set(self)
+        new = CopyOnWriteDict(dict.items(self))
+        new._shared = set(new)
+        return new
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        # pickles and deep copies don't share anything with this dict, and can be plain dicts.
+        #    Both copy the values, so the shared ones can be passed along as they are.
+        return dict, (list(dict.items(self)), )
+
+
+# selected meta.yaml text: parsed result.  Once selectors have been applied, the text fully
+#    determines the result, so repeated parses of the same recipe skip the yaml parser.
+_parsed_cache = utils.LRUCache(maxsize=256)
+
+
 def parse(data, config, path=None):
     data = select_lines(data, ns_cfg(config))
+    if data not in _parsed_cache:
+        _parsed_cache[data] = CopyOnWriteDict(_parse_selected(data, path))
+    # callers modify the result freely
+    return _parsed_cache[data].copy()
+
+
+def _parse_selected(data, path=None):
     res = yamlize(data)
     # ensure the result is a dict
     if res is None:
@@ -462,6 +642,36 @@ def _get_dependencies_from_environment(env_name_or_path):
     return {'requirements': {'build': bootstrap_requirements}}
 
 
+def _toposort_names(depends):
+    """Kahn's algorithm over depends, a dict of name: set of names it depends on.  Names come out
+    one level at a time (everything whose dependencies are all in earlier levels), sorted within
+    each level, which is the same order conda's _toposort gives."""
+    # name: names that depend on it
+    dependents = {name: [] for name in depends}
+    remaining = {}
+    for name, deps in depends.items():
+        deps = deps - {name}
+        remaining[name] = len(deps)
+        for dep in deps:
+            dependents[dep].append(name)
+    order = []
+    level = sorted(name for name, count in remaining.items() if not count)
+    while level:
+        order.extend(level)
+        next_level = []
+        for name in level:
+            for dependent in dependents[name]:
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    next_level.append(dependent)
+        level = sorted(next_level)
+    if len(order) != len(depends):
+        cyclic = [name for name in depends if remaining[name]]
+        raise ValueError("Cyclic dependencies exist among these items: {}".format(
+            " -> ".join(repr(name) for name in cyclic)))
+    return order
+
+
 def toposort(output_metadata_map, phase):
     '''This function is used to work out the order to run the install scripts
        for split packages based on any interdependencies. The result is just
@@ -470,35 +680,25 @@ def toposort(output_metadata_map, phase):
        will naturally lead to non-overlapping files in each package and also
        the correct files being present during the install and test procedures,
        provided they are run in this order.'''
-    from .conda_interface import _toposort
-    # We only care about the conda packages built by this recipe. Non-conda
-    # packages get sorted to the end.
-    these_packages = [output_d['name'] for output_d in output_metadata_map
-                      if output_d.get('type', 'conda') == 'conda']
-    topodict = dict()
-    order = dict()
-    endorder = set()
-    for idx, (output_d, output_m) in enumerate(output_metadata_map.items()):
+    # We only care about the conda packages built by this recipe.  Non-conda packages (wheels,
+    #    etc.) have no place in the ordering, and are not part of the result.
+    # name: output dicts with that name (one per variant), in map order
+    outputs_by_name = OrderedDict()
+    for output_d in output_metadata_map:
         if output_d.get('type', 'conda') == 'conda':
-            name = output_d['name']
-            order[name] = idx
-            topodict[name] = set()
-            for run_dep in output_m.get_value('requirements/{}'.format(phase), []):
-                run_dep = run_dep.split(' ')[0]
-                if run_dep in these_packages:
-                    topodict[name].update((run_dep,))
-        else:
-            endorder.add(idx)
-    topo_order = list(_toposort(topodict))
-    keys = [k for pkgname in topo_order for k in output_metadata_map.keys()
-            if 'name' in k and k['name'] == pkgname]
-    # not sure that this is working...  not everything has 'name', and not sure how this pans out
-    #    may end up excluding packages without the 'name' field
-    keys.extend([k for pkgname in endorder for k in output_metadata_map.keys()
-                 if 'name' in k and k['name'] == pkgname])
+            outputs_by_name.setdefault(output_d['name'], []).append(output_d)
+    depends = {name: set() for name in outputs_by_name}
+    for name, output_ds in outputs_by_name.items():
+        for output_d in output_ds:
+            for dep in output_metadata_map[output_d].get_value(
+                    'requirements/{}'.format(phase), []):
+                dep = dep.split(' ')[0]
+                if dep in depends:
+                    depends[name].add(dep)
     result = OrderedDict()
-    for key in keys:
-        result[key] = output_metadata_map[key]
+    for name in _toposort_names(depends):
+        for output_d in outputs_by_name[name]:
+            result[output_d] = output_metadata_map[output_d]
     return result
 
 
@@ -587,10 +787,157 @@ def get_updated_output_dict_from_reparsed_metadata(original_dict, new_outputs):
     return output_d
 
 
+# jinja template source (after selectors): (names the template looks up, whether its rendered
+#    output depends only on the values of those names)
+_template_variables_cache = utils.LRUCache(maxsize=256)
+# key from _rendered_template_key: (rendered text, undefined jinja variables)
+_rendered_template_cache = utils.LRUCache(maxsize=1024)
+# context functions whose result depends only on the config's variant and platform, which are
+#    made part of the cache key if a template uses them
+PURE_CONTEXT_FUNCTIONS = ('compiler', )
+
+
+def _template_variables(env, source):
+    if source not in _template_variables_cache:
+        import jinja2
+        from jinja2 import nodes
+        try:
+            ast = env.parse(source)
+        except jinja2.TemplateSyntaxError:
+            # let the normal render path report this
+            return set(), False
+        # included or imported templates are not part of source, so we can't tell whether
+        #    they have changed
+        cacheable = not any(ast.find_all((nodes.Extends, nodes.Include, nodes.Import,
+                                          nodes.FromImport)))
+        # every name that is looked up, including those that are globals of env (which jinja's
+        #    meta.find_undeclared_variables leaves out)
+        names = set(node.name for node in ast.find_all(nodes.Name) if node.ctx == 'load')
+        _template_variables_cache[source] = (names, cacheable)
+    return _template_variables_cache[source]
+
+
+def _rendered_template_key(env, source, config, permit_undefined_jinja):
+    """Returns a key that identifies the output of rendering source in env, or None if that
+    output can't be cached.
+
+    The key is made of the template source, and the values of the jinja variables that the
+    template actually uses.  Templates that call context functions (other than those in
+    PURE_CONTEXT_FUNCTIONS) can have side effects or read other files, and are never cached."""
+    import jinja2
+    names, cacheable = _template_variables(env, source)
+    if not cacheable:
+        return None
+    values = {}
+    for name in sorted(names):
+        if name == 'environment':
+            # passed to template.render, rather than being a global
+            return None
+        value = env.globals.get(name)
+        if callable(value):
+            if name in PURE_CONTEXT_FUNCTIONS:
+                value = (config.platform, config.variant)
+            elif (value is jinja2.defaults.DEFAULT_NAMESPACE.get(name) and
+                    name != 'lipsum'):
+                # jinja's own range, dict, etc.
+                continue
+            else:
+                return None
+        values[name] = value
+    values = json.dumps(values, sort_keys=True, default=repr)
+    return (hashlib.sha1(source.encode('utf-8')).hexdigest(),
+            hashlib.sha1(values.encode('utf-8')).hexdigest(),
+            permit_undefined_jinja)
+
+
+# (recipe dir, conda env dir, permit_undefined_jinja): jinja2 Environment.  Environments are
+#    kept so that jinja's cache of compiled templates is reused across parses of the same recipe
+#    (for each variant and output).
+_jinja_environments = utils.LRUCache(maxsize=32)
+
+
+def _get_jinja_environment(path, config, permit_undefined_jinja):
+    """Returns the jinja2 Environment to render templates in recipe dir path with, with its
+    globals reset to jinja's defaults.  The caller is expected to add the per-render globals."""
+    import jinja2
+    from jinja2.defaults import DEFAULT_NAMESPACE
+    from conda_build.jinja_context import (FilteredLoader, MemoryBytecodeCache,
+                                           UndefinedNeverFail)
+
+    # search relative to current conda environment directory
+    conda_env_path = os.environ.get('CONDA_DEFAULT_ENV')  # path to current conda environment
+    if conda_env_path and os.path.isdir(conda_env_path):
+        conda_env_path = os.path.abspath(conda_env_path)
+        conda_env_path = conda_env_path.replace('\\', '/')  # need unix-style path
+    else:
+        conda_env_path = None
+
+    key = (path, conda_env_path, permit_undefined_jinja)
+    if key not in _jinja_environments:
+        loaders = [  # search relative to '<conda_root>/Lib/site-packages/conda_build/templates'
+                   jinja2.PackageLoader('conda_build'),
+                   # search relative to RECIPE_DIR
+                   jinja2.FileSystemLoader(path)
+                   ]
+        if conda_env_path:
+            env_loader = jinja2.FileSystemLoader(conda_env_path)
+            loaders.append(jinja2.PrefixLoader({'$CONDA_DEFAULT_ENV': env_loader}))
+
+        undefined_type = UndefinedNeverFail if permit_undefined_jinja else jinja2.StrictUndefined
+        loader = FilteredLoader(jinja2.ChoiceLoader(loaders), config=config)
+        _jinja_environments[key] = jinja2.Environment(loader=loader, undefined=undefined_type,
+                                                      bytecode_cache=MemoryBytecodeCache())
+
+    env = _jinja_environments[key]
+    # selectors are evaluated against this config when the loader reads a template
+    env.loader.config = config
+    env.globals.clear()
+    env.globals.update(DEFAULT_NAMESPACE)
+    return env
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return (st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime), st.st_ino)
+
+
+# recipe dir: (stat keys of the directories in it, files in it that go into the hash).  Adding,
+#    removing or renaming a file changes the mtime of the directory holding it, so the listing
+#    is redone then.
+_recipe_files_cache = utils.LRUCache(maxsize=256)
+# (recipe dir, digest of the hashed metadata, stat keys of the hashed files): hash hexdigest
+_dependency_hash_cache = utils.LRUCache(maxsize=1024)
+
+
+def _recipe_files(path):
+    """Returns the paths, relative to recipe dir path, of the recipe files that are part of the
+    hash.  meta.yaml is left out (the hashed metadata covers its content), as are run_test
+    scripts, which can be renamed from subpackages."""
+    cached = _recipe_files_cache.get(path)
+    if cached:
+        try:
+            if all(_stat_key(d) == key for d, key in cached[0]):
+                return cached[1]
+        except OSError:
+            pass
+    dirs = []
+    files = []
+    for root, _, filenames in os.walk(path):
+        dirs.append((root, _stat_key(root)))
+        files.extend(os.path.join(root, f) for f in filenames)
+    file_paths = sorted([f.replace(path + os.sep, '') for f in files])
+    file_paths = [f for f in file_paths if not (f == 'meta.yaml' or f.startswith('run_test'))]
+    file_paths = filter_files(file_paths, path)
+    _recipe_files_cache[path] = (dirs, file_paths)
+    return file_paths
+
+
 class MetaData(object):
     def __init__(self, path, config=None, variant=None):
 
         self.undefined_jinja_vars = []
+        # (inputs that build_id depends on, build_id), kept while the metadata is final
+        self._build_id_cache = None
         # decouple this config from whatever was fed in.  People must change config by
         #    accessing and changing this attribute.
         self.config = get_or_merge_config(config, variant=variant).copy()
@@ -623,6 +970,7 @@ class MetaData(object):
 
     @final.setter
     def final(self, boolean):
+        self._build_id_cache = None
         extra = self.meta.get('extra', {})
         extra['final'] = boolean
         self.meta['extra'] = extra
@@ -954,15 +1302,7 @@ class MetaData(object):
                 with open(recorded_input_files) as f:
                     file_paths = f.read().splitlines()
             else:
-                files = utils.rec_glob(self.path, "*")
-                file_paths = sorted([f.replace(self.path + os.sep, '') for f in files])
-                # exclude meta.yaml and , because the json dictionary captures their content
-                # never include run_test - these can be renamed from subpackages, or the top-level
-                #    and if they're part of the top-level only, there will be missing files in the
-                #    subpackage
-                file_paths = [f for f in file_paths if not (f == 'meta.yaml' or
-                                                            f.startswith('run_test'))]
-                file_paths = filter_files(file_paths, self.path)
+                file_paths = _recipe_files(self.path)
         trim_empty_keys(composite)
         return composite, sorted(file_paths)
 
@@ -975,14 +1315,34 @@ class MetaData(object):
         #    need to be unique within one version
         # plus one is for the h - zero pad on the front, trim to match HASH_LENGTH
         recipe_input, file_paths = self._get_hash_contents()
-        hash_ = hashlib.sha1(json.dumps(recipe_input, sort_keys=True).encode())
-        for recipe_file in file_paths:
-            with open(os.path.join(self.path, recipe_file), 'rb') as f:
-                hash_.update(f.read())
-        hash_ = 'h{0}'.format(hash_.hexdigest())[:self.config.hash_length + 1]
+        recipe_input = json.dumps(recipe_input, sort_keys=True).encode()
+        # recipe files are only read again once their stat info changes
+        key = (self.path, hashlib.sha1(recipe_input).hexdigest(),
+               tuple((f, _stat_key(os.path.join(self.path, f))) for f in file_paths))
+        if key not in _dependency_hash_cache:
+            hash_ = hashlib.sha1(recipe_input)
+            for recipe_file in file_paths:
+                with open(os.path.join(self.path, recipe_file), 'rb') as f:
+                    hash_.update(f.read())
+            _dependency_hash_cache[key] = hash_.hexdigest()
+        hash_ = 'h{0}'.format(_dependency_hash_cache[key])[:self.config.hash_length + 1]
         return hash_
 
     def build_id(self):
+        # dist() and pkg_fn() are called over and over on finalized metadata, whose recipe no
+        #    longer changes.  Anything that does change it is expected to unset final first.
+        if self.final:
+            key = (self.get_value('build/string'), self.config.filename_hashing,
+                   self.config.hash_length)
+            cached = getattr(self, '_build_id_cache', None)
+            if cached and cached[0] == key:
+                return cached[1]
+            out = self._build_id()
+            self._build_id_cache = (key, out)
+            return out
+        return self._build_id()
+
+    def _build_id(self):
         out = self.get_value('build/string')
         if out:
             check_bad_chrs(out, 'build/string')
@@ -1148,32 +1508,16 @@ class MetaData(object):
             with open(self.meta_path) as fd:
                 return fd.read()
 
-        from conda_build.jinja_context import context_processor, UndefinedNeverFail, FilteredLoader
+        from conda_build.jinja_context import context_processor, UndefinedNeverFail
 
         path, filename = os.path.split(self.meta_path)
-        loaders = [  # search relative to '<conda_root>/Lib/site-packages/conda_build/templates'
-                   jinja2.PackageLoader('conda_build'),
-                   # search relative to RECIPE_DIR
-                   jinja2.FileSystemLoader(path)
-                   ]
-
-        # search relative to current conda environment directory
-        conda_env_path = os.environ.get('CONDA_DEFAULT_ENV')  # path to current conda environment
-        if conda_env_path and os.path.isdir(conda_env_path):
-            conda_env_path = os.path.abspath(conda_env_path)
-            conda_env_path = conda_env_path.replace('\\', '/')  # need unix-style path
-            env_loader = jinja2.FileSystemLoader(conda_env_path)
-            loaders.append(jinja2.PrefixLoader({'$CONDA_DEFAULT_ENV': env_loader}))
-
-        undefined_type = jinja2.StrictUndefined
         if permit_undefined_jinja:
             # The UndefinedNeverFail class keeps a global list of all undefined names
             # Clear any leftover names from the last parse.
             UndefinedNeverFail.all_undefined_names = []
-            undefined_type = UndefinedNeverFail
 
-        loader = FilteredLoader(jinja2.ChoiceLoader(loaders), config=self.config)
-        env = jinja2.Environment(loader=loader, undefined=undefined_type)
+        env = _get_jinja_environment(path, self.config, permit_undefined_jinja)
+        loader = env.loader
 
         env.globals.update(ns_cfg(self.config))
         env.globals.update(context_processor(self, path, config=self.config,
@@ -1189,13 +1533,26 @@ class MetaData(object):
         #     keep selectors and all that.
 
         try:
+            source = loader.get_source(env, filename)[0]
+            key = _rendered_template_key(env, source, self.config, permit_undefined_jinja)
+            if key in _rendered_template_cache:
+                rendered, undefined_jinja_vars = _rendered_template_cache[key]
+                self.undefined_jinja_vars = list(undefined_jinja_vars)
+                return rendered
+
             template = env.get_or_select_template(filename)
+            # templates given their own globals keep a copy of the environment's.  Otherwise
+            #    (as here) they share env.globals, which must not be cleared.
+            if template.globals is not env.globals:
+                template.globals.update(env.globals)
             rendered = template.render(environment=env)
 
             if permit_undefined_jinja:
                 self.undefined_jinja_vars = UndefinedNeverFail.all_undefined_names
             else:
                 self.undefined_jinja_vars = []
+            if key:
+                _rendered_template_cache[key] = (rendered, list(self.undefined_jinja_vars))
 
         except jinja2.TemplateError as ex:
             if "'None' has not attribute" in str(ex):
@@ -1328,7 +1685,11 @@ class MetaData(object):
     def copy(self):
         new = copy.copy(self)
         new.config = self.config.copy()
-        new.meta = copy.deepcopy(self.meta)
+        new._build_id_cache = None
+        if not isinstance(self.meta, CopyOnWriteDict):
+            self.meta = CopyOnWriteDict(self.meta)
+        # sections are only copied once they're looked up in either object
+        new.meta = self.meta.copy()
         return new
 
     @property
@@ -7,11 +7,15 @@
 from __future__ import absolute_import, division, print_function
 
 from collections import OrderedDict
+import hashlib
+import json
 from locale import getpreferredencoding
+import multiprocessing
 import os
 from os.path import isdir, isfile, abspath
 import random
 import re
+import shutil
 import subprocess
 import string
 import sys
@@ -31,7 +35,7 @@ import conda_build.source as source
 from conda_build.variants import (get_package_variants, dict_of_lists_to_list_of_dicts,
                                   conform_variants_to_value)
 from conda_build.exceptions import DependencyNeedsBuildingError
-from conda_build.index import get_build_index
+from conda_build.index import get_build_index, index_fingerprint
 # from conda_build.jinja_context import pin_subpackage_against_outputs
 
 
@@ -56,7 +60,8 @@ def actions_to_pins(actions):
 
 def get_env_dependencies(m, env, variant, exclude_pattern=None):
     dash_or_under = re.compile("[-_]")
-    index, index_ts = get_build_index(m.config, getattr(m.config, "{}_subdir".format(env)))
+    subdir = getattr(m.config, "{}_subdir".format(env))
+    index, index_ts = get_build_index(m.config, subdir)
     specs = [ms.spec for ms in m.ms_depends(env)]
     # replace x.x with our variant's numpy version, or else conda tries to literally go get x.x
     if env == 'build':
@@ -87,7 +92,7 @@ def get_env_dependencies(m, env, variant, exclude_pattern=None):
     with TemporaryDirectory(prefix="_", suffix=random_string) as tmpdir:
         try:
             actions = environ.get_install_actions(tmpdir, index, dependencies, m.config,
-                                                  timestamp=index_ts)
+                                                  timestamp=index_ts, subdir=subdir)
         except UnsatisfiableError as e:
             # we'll get here if the environment is unsatisfiable
             raise DependencyNeedsBuildingError(e)
@@ -310,6 +315,119 @@ def reparse(metadata):
     return metadata
 
 
+def _render_variant(args):
+    """Renders metadata for a single variant, for distribute_variants.  Takes a single tuple of
+    (metadata, variant, recipe_requirements, vars_in_recipe, parse, allow_no_other_outputs,
+    bypass_env_check), so that it can be mapped over a pool of worker processes.  metadata must
+    already have been parsed permissively, without a variant, to find vars_in_recipe.
+
+    Returns a tuple of 4 items:
+        metadata for the variant,
+        whether its source needs downloading (None if that was not determined),
+        packages that need building for it (None if the variant could be satisfied),
+        whether it needs to be parsed again in its build environment
+    """
+    (metadata, variant, recipe_requirements, vars_in_recipe, parse, allow_no_other_outputs,
+     bypass_env_check) = args
+    mv = metadata.copy()
+
+    mv.config.variant = variant
+    conform_dict = {}
+    for key in vars_in_recipe:
+        if PY3 and hasattr(recipe_requirements, 'decode'):
+            recipe_requirements = recipe_requirements.decode()
+        elif not PY3 and hasattr(recipe_requirements, 'encode'):
+            recipe_requirements = recipe_requirements.encode()
+        # We use this variant in the top-level recipe.
+        # constrain the stored variants to only this version in the output
+        #     variant mapping
+        if re.search(r"\s+\{\{\s*%s\s*(?:.*?)?\}\}" % key, recipe_requirements):
+            conform_dict[key] = variant[key]
+
+    compiler_matches = re.findall(r"compiler\([\'\"](.*)[\'\"].*\)",
+                                  recipe_requirements)
+    if compiler_matches:
+        from conda_build.jinja_context import native_compiler
+        for match in compiler_matches:
+            compiler_key = '{}_compiler'.format(match)
+            conform_dict[compiler_key] = variant.get(compiler_key,
+                                                     native_compiler(match, mv.config))
+            conform_dict['target_platform'] = variant['target_platform']
+
+    build_reqs = mv.meta.get('requirements', {}).get('build', [])
+    if 'python' in build_reqs:
+        conform_dict['python'] = variant['python']
+
+    mv.config.variants = conform_variants_to_value(mv.config.variants, conform_dict)
+    # reset this to our current variant to go ahead
+    mv.config.variant = variant
+
+    if not parse:
+        return mv, None, None, False
+
+    try:
+        mv.parse_until_resolved(allow_no_other_outputs=allow_no_other_outputs,
+                                bypass_env_check=bypass_env_check)
+    except DependencyNeedsBuildingError as e:
+        return mv, None, e.packages, False
+    except exceptions.UnableToParseMissingSetuptoolsDependencies:
+        return mv, None, None, True
+
+    need_source_download = (bool(mv.meta.get('source')) and
+                            not mv.needs_source_for_render and
+                            not os.listdir(mv.config.work_dir))
+    # if python is in the build specs, but doesn't have a specific associated
+    #    version, make sure to add one to newly parsed 'requirements/build'.
+    if build_reqs and 'python' in build_reqs:
+        python_version = 'python {}'.format(mv.config.variant['python'])
+        mv.meta['requirements']['build'] = [
+            python_version if re.match('^python(?:$| .*)', pkg) else pkg
+            for pkg in mv.meta['requirements']['build']]
+    return mv, need_source_download, None, False
+
+
+def _group_variants_by_used_keys(metadata, variants, vars_in_recipe):
+    """Groups variants that have the same values for all of the keys that metadata's recipe uses.
+    Returns a list of the groups (lists of variants), in the order of their first variants."""
+    if metadata.meta_path:
+        from conda_build.jinja_context import get_used_variants
+        used_keys = get_used_variants(metadata) | set(vars_in_recipe)
+    else:
+        # no recipe text to look for keys in
+        used_keys = set(key for variant in variants for key in variant)
+    groups = OrderedDict()
+    for variant in variants:
+        used = {key: value for key, value in variant.items() if key in used_keys}
+        groups.setdefault(json.dumps(used, sort_keys=True, default=repr), []).append(variant)
+    return list(groups.values())
+
+
+def _render_variant_in_worker(args):
+    """Renders a variant in a pool worker process, with its own copy of the work dir.  Rendering
+    can run setup.py there, and copies output scripts into it, so workers can't share it."""
+    metadata = args[0]
+    private_root = tempfile.mkdtemp(prefix='render_work_')
+    try:
+        private_work_dir = os.path.join(private_root, 'work')
+        shutil.copytree(metadata.config.work_dir, private_work_dir, symlinks=True)
+        metadata.config.work_dir = private_work_dir
+        result = _render_variant(args)
+    finally:
+        utils.rm_rf(private_root)
+    # the parent goes on with the shared work dir
+    result[0].config.work_dir = None
+    return result
+
+
+def _render_variants_in_parallel(render_args, jobs):
+    pool = multiprocessing.Pool(min(jobs, len(render_args)))
+    try:
+        return pool.map(_render_variant_in_worker, render_args, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def distribute_variants(metadata, variants, permit_unsatisfiable_variants=False,
                         allow_no_other_outputs=False, bypass_env_check=False):
     rendered_metadata = {}
@@ -328,87 +446,71 @@ def distribute_variants(metadata, variants, permit_unsatisfiable_variants=False,
 
     if variants:
         recipe_requirements = metadata.extract_requirements_text()
-        for variant in variants:
-            mv = metadata.copy()
-
-            # this determines which variants were used, and thus which ones should be locked for
-            #     future rendering
-            mv.final = False
-            mv.config.variant = {}
-            mv.parse_again(permit_undefined_jinja=True, allow_no_other_outputs=True,
-                           bypass_env_check=True)
-            vars_in_recipe = set(mv.undefined_jinja_vars)
-
-            mv.config.variant = variant
-            conform_dict = {}
-            for key in vars_in_recipe:
-                if PY3 and hasattr(recipe_requirements, 'decode'):
-                    recipe_requirements = recipe_requirements.decode()
-                elif not PY3 and hasattr(recipe_requirements, 'encode'):
-                    recipe_requirements = recipe_requirements.encode()
-                # We use this variant in the top-level recipe.
-                # constrain the stored variants to only this version in the output
-                #     variant mapping
-                if re.search(r"\s+\{\{\s*%s\s*(?:.*?)?\}\}" % key, recipe_requirements):
-                    conform_dict[key] = variant[key]
-
-            compiler_matches = re.findall(r"compiler\([\'\"](.*)[\'\"].*\)",
-                                         recipe_requirements)
-            if compiler_matches:
-                from conda_build.jinja_context import native_compiler
-                for match in compiler_matches:
-                    compiler_key = '{}_compiler'.format(match)
-                    conform_dict[compiler_key] = variant.get(compiler_key,
-                                            native_compiler(match, mv.config))
-                    conform_dict['target_platform'] = variant['target_platform']
-
-            build_reqs = mv.meta.get('requirements', {}).get('build', [])
-            if 'python' in build_reqs:
-                conform_dict['python'] = variant['python']
-
-            mv.config.variants = conform_variants_to_value(mv.config.variants, conform_dict)
-            # reset this to our current variant to go ahead
-            mv.config.variant = variant
-
-            if not need_reparse_in_env:
-                try:
-                    mv.parse_until_resolved(allow_no_other_outputs=allow_no_other_outputs,
-                                            bypass_env_check=bypass_env_check)
-                    need_source_download = (bool(mv.meta.get('source')) and
-                                            not mv.needs_source_for_render and
-                                            not os.listdir(mv.config.work_dir))
-                    # if python is in the build specs, but doesn't have a specific associated
-                    #    version, make sure to add one to newly parsed 'requirements/build'.
-                    if build_reqs and 'python' in build_reqs:
-                        python_version = 'python {}'.format(mv.config.variant['python'])
-                        mv.meta['requirements']['build'] = [
-                            python_version if re.match('^python(?:$| .*)', pkg) else pkg
-                            for pkg in mv.meta['requirements']['build']]
-                    # finalization is important here for the sake of
-                    #   deduplication. Without finalizing, we don't know
-                    #   whether two metadata objects will yield the same thing.
-                    # fm = finalize_metadata(mv)
-                    #  However, finalization means that all downloading must have already been done.
-                    #   This is not necessary, so let's see if we can get away
-                    #    with un-finalized data
-                    rendered_metadata[mv.dist()] = (mv, need_source_download, need_reparse_in_env)
-                except DependencyNeedsBuildingError as e:
-                    unsatisfiable_variants.append(variant)
-                    packages_needing_building.update(set(e.packages))
-                    if permit_unsatisfiable_variants:
-                        rendered_metadata[mv.dist()] = (mv, need_source_download,
-                                                        need_reparse_in_env)
-                    continue
-                except exceptions.UnableToParseMissingSetuptoolsDependencies:
-                    need_reparse_in_env = True
-                except:
-                    raise
-            else:
+
+        # this determines which variants were used, and thus which ones should be locked for
+        #     future rendering.  It is the same for every variant, so it only needs to be done
+        #     once.
+        base = metadata.copy()
+        base.final = False
+        base.config.variant = {}
+        base.parse_again(permit_undefined_jinja=True, allow_no_other_outputs=True,
+                         bypass_env_check=True)
+        vars_in_recipe = set(base.undefined_jinja_vars)
+
+        # Variants that only differ in keys that the recipe doesn't use render identically, and
+        #    used to be deduplicated after rendering each of them, keeping the last one.  Only
+        #    that last one is rendered now, in place of the first one.
+        groups = _group_variants_by_used_keys(metadata, variants, vars_in_recipe)
+        render_args = [(base, group[-1], recipe_requirements, vars_in_recipe, True,
+                        allow_no_other_outputs, bypass_env_check) for group in groups]
+        # Variants are rendered independently in worker processes, but their results are
+        #    merged here in the order of variants, just like rendering them one at a time.
+        parallel_results = None
+        if metadata.config.render_jobs > 1 and len(render_args) > 1:
+            parallel_results = _render_variants_in_parallel(render_args,
+                                                            metadata.config.render_jobs)
+
+        for i, group in enumerate(groups):
+            variant = group[-1]
+            if need_reparse_in_env:
                 # computes hashes based on whatever the current specs are - not the final specs
                 #    This is a deduplication step.  Any variants that end up identical because a
-                #    given variant is not used in a recipe are effectively ignored, though we still
-                #    pay the price to parse for that variant.
+                #    given variant is not used in a recipe are effectively ignored.
+                mv = _render_variant(render_args[i][:4] + (False, ) + render_args[i][5:])[0]
                 rendered_metadata[mv.build_id()] = (mv, need_source_download, need_reparse_in_env)
+                continue
+
+            if parallel_results:
+                result = parallel_results[i]
+            else:
+                result = _render_variant(render_args[i])
+            mv, variant_needs_download, variant_packages_needing_building, needs_env = result
+
+            if needs_env:
+                # as when rendering one at a time, this variant is left out, and the ones after it
+                #    are rendered again without parsing, whether or not the pool did them.
+                need_reparse_in_env = True
+                if len(group) > 1:
+                    # the rest of this group would have been rendered without parsing
+                    mv = _render_variant(render_args[i][:4] + (False, ) + render_args[i][5:])[0]
+                    rendered_metadata[mv.build_id()] = (mv, need_source_download,
+                                                        need_reparse_in_env)
+            elif variant_packages_needing_building is not None:
+                unsatisfiable_variants.append(variant)
+                packages_needing_building.update(set(variant_packages_needing_building))
+                if permit_unsatisfiable_variants:
+                    rendered_metadata[mv.dist()] = (mv, need_source_download,
+                                                    need_reparse_in_env)
+            else:
+                need_source_download = variant_needs_download
+                # finalization is important here for the sake of
+                #   deduplication. Without finalizing, we don't know
+                #   whether two metadata objects will yield the same thing.
+                # fm = finalize_metadata(mv)
+                #  However, finalization means that all downloading must have already been done.
+                #   This is not necessary, so let's see if we can get away
+                #    with un-finalized data
+                rendered_metadata[mv.dist()] = (mv, need_source_download, need_reparse_in_env)
     else:
         rendered_metadata['base_recipe'] = (metadata, need_source_download, need_reparse_in_env)
 
@@ -500,6 +602,102 @@ def render_recipe(recipe_path, config, no_download_source=False, variants=None,
     return rendered_metadata
 
 
+# bump this whenever what is stored in the render cache changes
+RENDER_CACHE_FORMAT = 1
+# config settings that don't change how a recipe renders
+_RENDER_CACHE_IGNORED_SETTINGS = ('_build_id', 'index', 'variants', 'render_jobs', 'render_cache',
+                                  'render_cache_size', 'verbose', 'debug', 'timeout', 'token',
+                                  'password', 'user', 'anaconda_upload')
+
+
+def render_cache_key(recipe_path, config, variants=None, **kwargs):
+    """Returns a key for the result of rendering the recipe at recipe_path (as api.render does,
+    with the remaining keyword arguments), or None if that can't be cached.
+
+    The key is made of the contents of the recipe directory, the variants that it would be
+    rendered with, the config, any environment variables that the recipe mentions, the packages
+    available in the build and host indexes, and the conda-build version.  Recipes that include
+    or import other templates are not cached."""
+    from conda_build import __version__
+    if not isdir(recipe_path):
+        return None
+    recipe_path = abspath(recipe_path)
+
+    contents = {}
+    meta_text = ''
+    for root, dirs, files in os.walk(recipe_path):
+        for f in files:
+            path = os.path.join(root, f)
+            contents[os.path.relpath(path, recipe_path)] = utils.file_digests(path)['sha256']
+            if f == 'meta.yaml':
+                with open(path, 'rb') as fh:
+                    meta_text += fh.read().decode('utf-8', 'replace')
+
+    # included or imported templates may live anywhere, so whether they changed isn't known
+    import jinja2
+    from conda_build.metadata import _template_variables
+    if not _template_variables(jinja2.Environment(), meta_text)[1]:
+        return None
+
+    environment = {key: value for key, value in os.environ.items()
+                   if re.search(r'\b{}\b'.format(re.escape(key)), meta_text)}
+
+    indexes = {}
+    for subdir in sorted(set((config.build_subdir, config.host_subdir))):
+        index, _ = get_build_index(config, subdir)
+        indexes[subdir] = index_fingerprint(index)
+
+    settings = {key: value for key, value in config.__dict__.items()
+                if key not in _RENDER_CACHE_IGNORED_SETTINGS}
+
+    key = json.dumps([RENDER_CACHE_FORMAT, __version__, recipe_path, contents,
+                      variants or get_package_variants(recipe_path, config), settings,
+                      environment, indexes, kwargs], sort_keys=True, default=repr)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def load_cached_render(key, config):
+    """Returns the rendered metadata tuples stored under key in the render cache, or None."""
+    import pickle
+    path = os.path.join(config.render_cache_dir, key + '.pickle')
+    try:
+        with open(path, 'rb') as f:
+            name, metadata_tuples = pickle.load(f)
+        # this is what eviction goes by
+        os.utime(path, None)
+    except Exception:
+        # missing, or left unreadable by another version of python or conda-build
+        return None
+
+    # render sets this up on the config passed in, and the cached metadata would otherwise refer
+    #    to the build folders of whatever run rendered it
+    if config.set_build_id:
+        config.compute_build_id(name, reset=True)
+    for m, _, _ in metadata_tuples:
+        cached_config = m.config
+        m.config = config.copy()
+        m.config.variant = cached_config.variant
+        if hasattr(cached_config, 'variants'):
+            m.config.variants = cached_config.variants
+    return metadata_tuples
+
+
+def save_cached_render(key, metadata_tuples, config):
+    """Stores metadata_tuples in the render cache under key, then evicts the least recently used
+    entries until the cache is no bigger than config.render_cache_size."""
+    # metadata that needed source to render can depend on more than the recipe
+    if not metadata_tuples or any(download or m.needs_source_for_render
+                                  for m, download, _ in metadata_tuples):
+        return
+    path = os.path.join(config.render_cache_dir, key + '.pickle')
+    try:
+        utils.write_pickle((metadata_tuples[0][0].name(), metadata_tuples), path)
+    except Exception as e:
+        utils.get_logger(__name__).debug("Not caching rendered recipe: %s", e)
+        return
+    utils.trim_cache_dir(config.render_cache_dir, config.render_cache_size)
+
+
 # Next bit of stuff is to support YAML output in the order we expect.
 # http://stackoverflow.com/a/17310199/1170370
 class _MetaYaml(dict):
@@ -532,7 +730,7 @@ else:
 
 
 def output_yaml(metadata, filename=None):
-    output = yaml.dump(_MetaYaml(metadata.meta), Dumper=_IndentDumper,
+    output = yaml.dump(_MetaYaml(metadata.meta.items()), Dumper=_IndentDumper,
                        default_flow_style=False, indent=4)
     if filename:
         if any(sep in filename for sep in ('\\', '/')):
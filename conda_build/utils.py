@@ -1,10 +1,11 @@
 from __future__ import absolute_import, division, print_function
 
 import base64
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import contextlib
 import fnmatch
 from glob import glob
+import hashlib
 import json
 from locale import getpreferredencoding
 import logging
@@ -19,6 +20,7 @@ import sys
 import shutil
 import tarfile
 import tempfile
+import threading
 import time
 import zipfile
 
@@ -27,7 +29,7 @@ import filelock
 
 from conda import __version__ as conda_version
 
-from .conda_interface import hashsum_file, md5_file, unix_path_to_win, win_path_to_unix
+from .conda_interface import unix_path_to_win, win_path_to_unix
 from .conda_interface import PY3, iteritems
 from .conda_interface import root_dir, pkgs_dirs
 from .conda_interface import string_types, url_path, get_rc_urls
@@ -400,11 +402,113 @@ def unzip(zip_path, dir_path):
     z.close()
 
 
+class LRUCache(object):
+    """A mapping for memoizing, which holds at most maxsize items.  Adding one more drops the one
+    that was least recently looked up or added."""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._items.pop(key)
+            # most recently used is last
+            self._items[key] = value
+            return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# path: (stat key, digests).  The stat key is (size, mtime, inode), so an entry goes stale as
+#    soon as the file at its path is modified or replaced.
+_digest_cache = LRUCache(maxsize=10000)
+
+
+def file_digests(path, buffersize=65536):
+    """Returns a dict with the md5 and sha256 hex digests of the file at path.  Both digests
+    are computed from a single read of the file, and are cached for as long as the file's
+    size, mtime and inode stay the same."""
+    path = abspath(path)
+    st = os.stat(path)
+    stat_key = (st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime), st.st_ino)
+    cached = _digest_cache.get(path)
+    if cached and cached[0] == stat_key:
+        return dict(cached[1])
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(buffersize), b''):
+            md5.update(block)
+            sha256.update(block)
+    digests = {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest()}
+    _digest_cache[path] = (stat_key, digests)
+    return dict(digests)
+
+
+def write_pickle(obj, path):
+    """Pickles obj to path.  It is written to a temporary file in the same directory first, so
+    that concurrent readers never see a partial file."""
+    import pickle
+    fd, tmp_path = tempfile.mkstemp(dir=dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        if on_win and isfile(path):
+            # os.rename won't replace an existing file on windows
+            os.unlink(path)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def trim_cache_dir(cache_dir, max_size, suffix='.pickle'):
+    """Removes the least recently used files ending in suffix from cache_dir until the rest add up
+    to no more than max_size bytes.  Readers of the cache are expected to touch the files that
+    they use."""
+    entries = []
+    for fn in os.listdir(cache_dir):
+        if fn.endswith(suffix):
+            st = os.stat(join(cache_dir, fn))
+            entries.append((st.st_mtime, st.st_size, fn))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, fn in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.unlink(join(cache_dir, fn))
+        except OSError:
+            # already evicted by another process
+            pass
+        total_size -= size
+
+
 def file_info(path):
-    return {'size': getsize(path),
-            'md5': md5_file(path),
-            'sha256': hashsum_file(path, 'sha256'),
-            'mtime': getmtime(path)}
+    info = file_digests(path)
+    info.update({'size': getsize(path),
+                 'mtime': getmtime(path)})
+    return info
 
 # Taken from toolz
 
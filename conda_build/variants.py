@@ -1,6 +1,7 @@
 """This file handles the parsing of feature specifications from files,
 ending up with a configuration matrix"""
 
+import copy
 from itertools import product
 import os
 import sys
@@ -312,5 +313,13 @@ def get_package_variants(recipedir_or_metadata, config=None):
     return dict_of_lists_to_list_of_dicts(combined_spec, config.platform)
 
 
+# platform: default variants.  Callers are free to modify what they get, so each call returns a
+#    copy.
+_default_variants_cache = {}
+
+
 def get_default_variants(platform=cc_platform):
-    return dict_of_lists_to_list_of_dicts(DEFAULT_VARIANTS, platform)
+    if platform not in _default_variants_cache:
+        _default_variants_cache[platform] = dict_of_lists_to_list_of_dicts(DEFAULT_VARIANTS,
+                                                                           platform)
+    return copy.deepcopy(_default_variants_cache[platform])
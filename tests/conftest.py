@@ -4,6 +4,7 @@ import sys
 
 import pytest
 
+from conda_build import config
 from conda_build.config import Config
 from conda_build.index import get_build_index
 from conda_build.conda_interface import subdir
@@ -12,6 +13,15 @@ from conda_build.metadata import MetaData
 from conda_build.utils import check_call_env, prepend_bin_path, copy_into, capture
 
 
+@pytest.fixture(autouse=True)
+def no_render_cache(monkeypatch):
+    """The render cache lives in croot, which tests that don't use testing_config share with
+    every other run.  It is off unless a test turns it on."""
+    monkeypatch.setattr(config, 'DEFAULTS', [config.Setting('render_cache', False)
+                                             if setting.name == 'render_cache' else setting
+                                             for setting in config.DEFAULTS])
+
+
 @pytest.fixture(scope='function')
 def testing_workdir(tmpdir, request):
     """ Create a workdir in a safe temporary folder; cd into dir above before test, cd out after
@@ -110,3 +110,26 @@ def test_pin_compatible_semver(testing_config):
     #    This is broken right now, because compound pins like we do here have never been supported
     #    in the build string.
     # assert 'np111' in api.get_output_file_path(metadata)
+
+
+def test_render_cache(testing_workdir, testing_config):
+    testing_config.render_cache = True
+    recipe = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe)
+    with open(os.path.join(recipe, 'meta.yaml'), 'w') as f:
+        f.write("package:\n  name: cached\n  version: 1.0\n")
+    first = api.render(recipe, config=testing_config)
+    with mock.patch.object(render, 'render_recipe', wraps=render.render_recipe) as render_recipe:
+        second = api.render(recipe, config=testing_config)
+        assert not render_recipe.called
+        assert [m.dist() for (m, _, _) in second] == [m.dist() for (m, _, _) in first]
+
+        # changes to the recipe are picked up
+        with open(os.path.join(recipe, 'meta.yaml'), 'a') as f:
+            f.write("build:\n  number: 1\n")
+        assert api.render(recipe, config=testing_config)[0][0].build_number() == 1
+        assert render_recipe.call_count == 1
+
+        api.render(recipe, config=testing_config, render_cache=False)
+        assert render_recipe.call_count == 2
+
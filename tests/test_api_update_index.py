@@ -1,6 +1,13 @@
+import bz2
+import json
 import os
+import tarfile
 
-from conda_build import api
+import pytest
+
+from conda_build import api, index, utils
+from conda_build.index import update_index
+from conda_build.utils import get_lock
 
 
 def test_update_index(testing_workdir, testing_config):
@@ -8,3 +15,163 @@ def test_update_index(testing_workdir, testing_config):
     files = ".index.json", "repodata.json", "repodata.json.bz2"
     for f in files:
         assert os.path.isfile(os.path.join(testing_workdir, f))
+
+
+def _make_package(dir_path, name, depends=()):
+    fn = '{}-1.0-0.tar.bz2'.format(name)
+    index_json = os.path.join(dir_path, 'index.json')
+    with open(index_json, 'w') as f:
+        json.dump({'name': name, 'version': '1.0', 'build': '0', 'build_number': 0,
+                   'subdir': 'linux-64', 'arch': 'x86_64', 'platform': 'linux',
+                   'depends': list(depends)}, f)
+    with tarfile.open(os.path.join(dir_path, fn), 'w:bz2') as t:
+        t.add(index_json, 'info/index.json')
+    os.remove(index_json)
+    return fn
+
+
+def _load(dir_path, fn):
+    with open(os.path.join(dir_path, fn)) as f:
+        return json.load(f)
+
+
+def test_update_index_incremental(testing_workdir, testing_config):
+    first = _make_package(testing_workdir, 'first')
+    api.update_index(testing_workdir, testing_config)
+
+    second = _make_package(testing_workdir, 'second', depends=['first'])
+    update_index(testing_workdir, testing_config, filenames=[second])
+    assert os.path.isfile(os.path.join(testing_workdir, index.INDEX_JOURNAL))
+    incremental = _load(testing_workdir, 'repodata.json')
+    assert sorted(incremental['packages']) == [first, second]
+    assert 'platform' not in incremental['packages'][second]
+
+    # a full update folds the journal into .index.json, and produces the same repodata
+    update_index(testing_workdir, testing_config)
+    assert not os.path.isfile(os.path.join(testing_workdir, index.INDEX_JOURNAL))
+    assert sorted(_load(testing_workdir, '.index.json')) == [first, second]
+    assert _load(testing_workdir, 'repodata.json') == incremental
+
+    # removed packages are dropped from the index
+    os.remove(os.path.join(testing_workdir, second))
+    update_index(testing_workdir, testing_config, filenames=[second])
+    assert sorted(_load(testing_workdir, 'repodata.json')['packages']) == [first]
+
+
+def test_update_index_incremental_without_repodata(testing_workdir, testing_config):
+    fn = _make_package(testing_workdir, 'first')
+    update_index(testing_workdir, testing_config, filenames=[])
+    assert sorted(_load(testing_workdir, 'repodata.json')['packages']) == [fn]
+
+
+def test_update_index_threads(testing_workdir, testing_config):
+    for name in ('first', 'second', 'third'):
+        _make_package(testing_workdir, name)
+    testing_config.threads = 1
+    api.update_index(testing_workdir, testing_config, force=True)
+    serial = _load(testing_workdir, '.index.json')
+    testing_config.threads = 2
+    api.update_index(testing_workdir, testing_config, force=True)
+    assert _load(testing_workdir, '.index.json') == serial
+    assert sorted(serial) == ['first-1.0-0.tar.bz2', 'second-1.0-0.tar.bz2',
+                              'third-1.0-0.tar.bz2']
+
+
+def test_write_repodata_matches_json_dumps(testing_workdir, testing_config):
+    packages = {}
+    for i in range(2000):
+        packages['pkg%d-1.0-0.tar.bz2' % i] = {
+            'name': 'pkg%d' % i, 'version': '1.0', 'build': '0', 'build_number': 0,
+            'depends': ['python 2.7*', u'd\xe9p'], 'license': None, 'size': i,
+            'md5': '%032x' % i, 'sig': None}
+    repodata = {'packages': packages, 'info': {'subdir': 'linux-64'}}
+
+    # this is how repodata was written before it was streamed
+    expected = json.dumps(repodata, indent=2, sort_keys=True)
+    expected = '\n'.join(line.rstrip() for line in expected.splitlines()) + '\n'
+
+    assert ''.join(index.iterencode_repodata(repodata, buffer_size=100)) == expected
+    index.write_repodata(repodata, testing_workdir, lock=get_lock(testing_workdir),
+                         config=testing_config)
+    with open(os.path.join(testing_workdir, 'repodata.json')) as f:
+        assert f.read() == expected
+    with open(os.path.join(testing_workdir, 'repodata.json.bz2'), 'rb') as f:
+        assert bz2.decompress(f.read()).decode('utf-8') == expected
+
+
+def test_update_build_index(testing_workdir, testing_config):
+    testing_config.output_folder = testing_workdir
+    subdir_path = os.path.join(testing_workdir, testing_config.host_subdir)
+    os.makedirs(subdir_path)
+    _make_package(subdir_path, 'first')
+    update_index(subdir_path, testing_config)
+    built_index, _ = index.get_build_index(testing_config, testing_config.host_subdir,
+                                           clear_cache=True, omit_defaults=True)
+    assert {dist.name for dist in built_index} >= {'first'}
+
+    fn = _make_package(subdir_path, 'second', depends=['first'])
+    update_index(subdir_path, testing_config, filenames=[fn])
+    updated_index, timestamp = index.update_build_index(testing_config,
+                                                        testing_config.host_subdir,
+                                                        omit_defaults=True)
+    assert {dist.name for dist in updated_index} >= {'first', 'second'}
+    # the cached index is left alone, for anything still using it
+    assert 'second' not in {dist.name for dist in built_index}
+    assert timestamp == os.path.getmtime(os.path.join(subdir_path, 'repodata.json'))
+
+
+def test_get_build_index_caches_subdirs(testing_workdir, testing_config, monkeypatch):
+    testing_config.output_folder = testing_workdir
+    index.clear_build_index_cache()
+    fetched = []
+
+    def get_index(channel_urls, platform, **kwargs):
+        fetched.append(platform)
+        return {}
+    monkeypatch.setattr(index, 'get_index', get_index)
+
+    for _ in range(3):
+        for subdir in ('linux-64', 'linux-aarch64', 'noarch'):
+            index.get_build_index(testing_config, subdir, omit_defaults=True)
+    # noarch packages are installed from the native subdir's index
+    assert sorted(fetched) == sorted({'linux-aarch64', 'linux-64',
+                                      index.conda_interface.subdir})
+
+    # indexing the local channel makes its index stale
+    update_index(os.path.join(testing_workdir, 'linux-64'), testing_config, force=True)
+    os.utime(os.path.join(testing_workdir, 'linux-64', 'repodata.json'), (2 ** 31, 2 ** 31))
+    index.get_build_index(testing_config, 'linux-64', omit_defaults=True)
+    index.get_build_index(testing_config, 'linux-aarch64', omit_defaults=True)
+    assert fetched.count('linux-64') == 2
+    assert fetched.count('linux-aarch64') == 1
+
+
+def test_write_repodata_failure_keeps_old_repodata(testing_workdir, testing_config,
+                                                   monkeypatch):
+    repodata = {'packages': {}, 'info': {'subdir': 'linux-64'}}
+    index.write_repodata(repodata, testing_workdir, lock=get_lock(testing_workdir),
+                         config=testing_config)
+    before = _load(testing_workdir, 'repodata.json')
+
+    def failing_iterencode(repodata):
+        yield '{\n'
+        raise KeyboardInterrupt
+    monkeypatch.setattr(index, 'iterencode_repodata', failing_iterencode)
+    with pytest.raises(KeyboardInterrupt):
+        index.write_repodata(repodata, testing_workdir, lock=get_lock(testing_workdir),
+                             config=testing_config)
+    assert _load(testing_workdir, 'repodata.json') == before
+    assert not [fn for fn in os.listdir(testing_workdir) if fn.endswith('.tmp')]
+
+
+def test_update_index_check_md5_hashes_once(testing_workdir, testing_config, mocker):
+    fn = _make_package(testing_workdir, 'first')
+    update_index(testing_workdir, testing_config)
+    # the same package, rebuilt
+    os.remove(os.path.join(testing_workdir, fn))
+    _make_package(testing_workdir, 'first', depends=['python'])
+    file_info = mocker.spy(index, 'file_info')
+    update_index(testing_workdir, testing_config, check_md5=True)
+    assert file_info.call_count == 0
+    md5 = utils.file_digests(os.path.join(testing_workdir, fn))['md5']
+    assert _load(testing_workdir, 'repodata.json')['packages'][fn]['md5'] == md5
@@ -3,6 +3,7 @@ This file tests the build.py module.  It sits lower in the stack than the API te
 and is more unit-test oriented.
 """
 
+import io
 import json
 import os
 import subprocess
@@ -42,6 +43,77 @@ def test_find_prefix_files(testing_workdir):
     assert len(list(build.have_prefix_files(files, testing_workdir))) == len(files)
 
 
+def test_find_prefix_files_parallel_matches_serial(testing_workdir):
+    files, files_without_prefix = [], []
+    for i in range(build.PARALLEL_PREFIX_SCAN_MIN_FILES + 10):
+        filename = "file_%03d" % i
+        with open(os.path.join(testing_workdir, filename), 'wb') as f:
+            if i % 3 == 0:
+                # binary file
+                f.write(b'\x00' + testing_workdir.encode('utf-8') + b'\x00')
+            elif i % 3 == 1:
+                f.write(testing_workdir.encode('utf-8') + b'\n')
+            else:
+                f.write(b'no prefix in here\n')
+                files_without_prefix.append(filename)
+        files.append(filename)
+    if hasattr(os, 'link'):
+        os.link(os.path.join(testing_workdir, files[1]), os.path.join(testing_workdir, 'link'))
+        files.append('link')
+
+    # the first pass rewrites text files to use the placeholder, so compare subsequent passes
+    list(build.have_prefix_files(files, testing_workdir, threads=1))
+    serial = list(build.have_prefix_files(files, testing_workdir, threads=1))
+    parallel = list(build.have_prefix_files(files, testing_workdir, threads=4))
+    assert serial == parallel
+    assert [f for _, _, f in parallel] == [f for f in files if f not in files_without_prefix]
+
+
+def test_find_needles():
+    needles = [b'\x00', b'/some/prefix', b'/opt/placeholder', b'nowhere']
+    data = b'text /some/prefix/bin\x00\x00 /opt/placeholder \x00/some/prefix'
+    assert build.find_needles(data, needles) == {b'\x00', b'/some/prefix', b'/opt/placeholder'}
+    # every needle must be found, no matter how many times needles before it occur
+    data = b'\x00' * 1000 + b'/opt/placeholder'
+    assert build.find_needles(data, needles) == {b'\x00', b'/opt/placeholder'}
+    # needles that overlap in the data
+    assert build.find_needles(b'abc', [b'ab', b'bc']) == {b'ab', b'bc'}
+    assert build.find_needles(b'', needles) == set()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1024])
+def test_replace_prefix_in_stream(chunk_size):
+    data = b'/old/prefix/bin:/old/prefix/lib /old/pre /old/prefix'
+    fo = io.BytesIO()
+    build._replace_prefix_in_stream(io.BytesIO(data), fo, b'/old/prefix', b'/new',
+                                    chunk_size=chunk_size)
+    assert fo.getvalue() == data.replace(b'/old/prefix', b'/new')
+
+
+@pytest.mark.skipif(on_win and sys.version[:3] == "2.7",
+                    reason="os.link is not available so can't setup test")
+def test_rewrite_file_with_new_prefix_keeps_hardlinks(testing_workdir):
+    path = os.path.join(testing_workdir, 'one')
+    path_hardlink = os.path.join(testing_workdir, 'one_hl')
+    other_path = os.path.join(testing_workdir, 'two')
+    for fn in (path, other_path):
+        with open(fn, 'wb') as f:
+            f.write(b'prefix=/old/prefix\n')
+    os.chmod(other_path, 0o755)
+    os.link(path, path_hardlink)
+
+    build.rewrite_file_with_new_prefix(path, b'/old/prefix', b'/new')
+    build.rewrite_file_with_new_prefix(other_path, b'/old/prefix', b'/new')
+    for fn in (path, path_hardlink, other_path):
+        with open(fn, 'rb') as f:
+            assert f.read() == b'prefix=/new\n'
+    assert os.stat(path).st_ino == os.stat(path_hardlink).st_ino
+    if not on_win:
+        assert os.stat(other_path).st_mode & 0o777 == 0o755
+    # temporary files are cleaned up
+    assert not [fn for fn in os.listdir(testing_workdir) if fn.startswith('.')]
+
+
 def test_build_preserves_PATH(testing_workdir, testing_config, testing_index):
     m = api.render(os.path.join(metadata_dir, 'source_git'), config=testing_config)[0][0]
     ref_path = os.environ['PATH']
@@ -87,6 +159,17 @@ def test_has_prefix():
     assert build.has_prefix("short/path/nope", files_with_prefix) == (None, None)
 
 
+def test_index_files_with_prefix():
+    files_with_prefix = [("prefix/path", "binary", "short/path/1"),
+                         ("other/path", "binary", "short/path/1"),
+                         ("prefix/path", "text", "short/path/2")]
+    prefix_index = build.index_files_with_prefix(files_with_prefix)
+    assert prefix_index == {"short/path/1": ("prefix/path", "binary"),
+                            "short/path/2": ("prefix/path", "text")}
+    for short_path in ("short/path/1", "short/path/2"):
+        assert prefix_index[short_path] == build.has_prefix(short_path, files_with_prefix)
+
+
 def test_is_no_link():
     no_link = ["path/1", "path/2"]
     assert build.is_no_link(no_link, "path/1") is True
@@ -110,6 +193,28 @@ def test_sorted_inode_first_path(testing_workdir):
     assert build.get_inode_paths(files, "two", testing_workdir) == ["two"]
 
 
+@pytest.mark.skipif(on_win and sys.version[:3] == "2.7",
+                    reason="os.link is not available so can't setup test")
+def test_inode_index(testing_workdir):
+    files = []
+    for i in range(10):
+        fn = "file_%d" % i
+        open(os.path.join(testing_workdir, fn), "a").close()
+        files.append(fn)
+        for j in range(i % 3):
+            link = "%s_hl_%d" % (fn, j)
+            os.link(os.path.join(testing_workdir, fn), os.path.join(testing_workdir, link))
+            files.append(link)
+
+    inode_index = build.get_inode_index(files, testing_workdir)
+    assert len(inode_index) == 10
+    for fn in files:
+        expected = build.get_inode_paths(files, fn, testing_workdir)
+        assert build.get_inode_paths(files, fn, testing_workdir, inode_index) == expected
+    assert build.get_inode_paths(files, "file_2_hl_1", testing_workdir, inode_index) == [
+        "file_2", "file_2_hl_0", "file_2_hl_1"]
+
+
 def test_create_info_files_json(testing_workdir, testing_metadata):
     info_dir = os.path.join(testing_workdir, "info")
     os.mkdir(info_dir)
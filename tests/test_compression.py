@@ -0,0 +1,65 @@
+import bz2
+import io
+import os
+import tarfile
+
+import pytest
+
+from conda_build import compression
+
+
+def _compress(data, compression_type='bz2', level=None, threads=1):
+    fo = io.BytesIO()
+    with compression.get_compressor(fo, compression_type, level=level,
+                                    threads=threads) as compressor:
+        compressor.write(data)
+    return fo.getvalue()
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'a',
+    # runs of 4 are the worst case for bzip2's initial run-length encoding
+    b'aaaabbbb' * 50000,
+    os.urandom(250000),
+])
+@pytest.mark.parametrize('level', [1, 9])
+def test_bz2_is_single_stream(data, level):
+    compressed = _compress(data, level=level)
+    decompressor = bz2.BZ2Decompressor()
+    assert decompressor.decompress(compressed) == data
+    # conda on python 2 can only read the first stream of a multi-stream bz2 file
+    assert decompressor.unused_data == b''
+    if not data:
+        assert compressed == bz2.compress(data, level)
+
+
+def test_bz2_output_does_not_depend_on_threads():
+    data = os.urandom(100000) * 4
+    serial = _compress(data, level=1, threads=1)
+    assert _compress(data, level=1, threads=3) == serial
+    assert bz2.decompress(serial) == data
+
+
+def test_bz2_tarfile_roundtrip(testing_workdir):
+    with open('file', 'wb') as f:
+        f.write(os.urandom(1000))
+    with open('pkg.tar.bz2', 'wb') as fo:
+        with compression.get_compressor(fo, 'bz2', level=1) as compressor:
+            t = tarfile.open(fileobj=compressor, mode='w|')
+            t.add('file')
+            t.close()
+    with tarfile.open('pkg.tar.bz2') as t:
+        with open('file', 'rb') as f:
+            assert t.extractfile('file').read() == f.read()
+
+
+def test_xz_roundtrip():
+    lzma = pytest.importorskip('lzma')
+    for data in (b'', b'abc' * 1000):
+        assert lzma.decompress(_compress(data, 'xz', level=1, threads=2)) == data
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        compression.get_compressor(io.BytesIO(), 'rar')
@@ -89,3 +89,11 @@ def test_get_or_create_config_does_not_change_passed_in_config(config):
     newconfig = get_or_merge_config(config, dirty=True)
     assert newconfig.dirty is True
     assert config.dirty is False
+
+
+def test_threads_default_to_serial(mocker):
+    assert Config().threads == 1
+    assert Config(_threads=4).threads == 4
+    # pool workers can't start pools of their own
+    mocker.patch('multiprocessing.current_process').return_value.daemon = True
+    assert Config(_threads=4).threads == 1
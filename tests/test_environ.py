@@ -1,3 +1,4 @@
+import json
 import os
 
 import pytest
@@ -60,3 +61,133 @@ def test_ensure_valid_spec():
     assert environ._ensure_valid_spec('python 2.7.12 0') == 'python 2.7.12 0'
     assert environ._ensure_valid_spec('python >=2.7,<2.8') == 'python >=2.7,<2.8'
     assert environ._ensure_valid_spec('numpy x.x') == 'numpy x.x'
+
+
+def test_install_actions_are_cached(testing_workdir, testing_config, mocker):
+    testing_config.solve_cache_on_disk = True
+    index, _ = environ.get_build_index(testing_config, testing_config.build_subdir)
+    solve = mocker.spy(environ, 'install_actions')
+    prefix = os.path.join(testing_workdir, 'env1')
+    actions = environ.get_install_actions(prefix, index, ['python'], testing_config,
+                                          subdir=testing_config.build_subdir)
+    assert solve.call_count == 1
+    assert os.listdir(testing_config.solve_cache_dir)
+
+    # same specs in another (empty) prefix: no new solve
+    other_prefix = os.path.join(testing_workdir, 'env2')
+    cached = environ.get_install_actions(other_prefix, index, ['python'], testing_config,
+                                         subdir=testing_config.build_subdir)
+    assert solve.call_count == 1
+    assert cached['PREFIX'] == other_prefix
+    assert [str(dist) for dist in cached['LINK']] == [str(dist) for dist in actions['LINK']]
+
+    # the disk tier outlives the in-memory one
+    environ._solve_cache.clear()
+    environ.get_install_actions(other_prefix, index, ['python'], testing_config,
+                                subdir=testing_config.build_subdir)
+    assert solve.call_count == 1
+
+    environ.get_install_actions(prefix, index, ['python', 'zlib'], testing_config,
+                                subdir=testing_config.build_subdir)
+    assert solve.call_count == 2
+
+
+def test_env_cloned_from_template(testing_workdir, testing_config, mocker):
+    testing_config.env_templates = True
+    execute = mocker.spy(environ, 'execute_actions')
+    first = os.path.join(testing_workdir, '_first_env')
+    environ.create_env(first, ['python'], testing_config, subdir=testing_config.build_subdir)
+    assert execute.call_count == 1
+    assert os.listdir(testing_config.env_templates_dir)
+
+    # same length, so that binary files can be rewritten too
+    second = os.path.join(testing_workdir, '_other_env')
+    environ.create_env(second, ['python'], testing_config, subdir=testing_config.build_subdir)
+    assert execute.call_count == 1
+    assert (sorted(os.listdir(os.path.join(second, 'conda-meta'))) ==
+            sorted(os.listdir(os.path.join(first, 'conda-meta'))))
+    for root, _, files in os.walk(second):
+        for fn in files:
+            path = os.path.join(root, fn)
+            if not fn.endswith(('.pyc', '.pyo')) and not os.path.islink(path):
+                with open(path, 'rb') as f:
+                    assert first.encode('utf-8') not in f.read(), path
+
+    # files that aren't shared with the package cache are not shared with the template either
+    template_dir, = os.listdir(testing_config.env_templates_dir)
+    with open(os.path.join(testing_config.env_templates_dir, template_dir, 'template.json')) as f:
+        copied = json.load(f)['copied']
+    for path in copied:
+        assert os.stat(os.path.join(second, path)).st_nlink == 1, path
+    # compiled when linking, with the template's prefix in them
+    assert not [path for path in copied if path.endswith(('.pyc', '.pyo'))]
+
+
+def test_package_has_prefix(testing_workdir, monkeypatch):
+    info_dir = os.path.join(testing_workdir, 'pkg-1.0-0', 'info')
+    os.makedirs(info_dir)
+    with open(os.path.join(info_dir, 'has_prefix'), 'w') as f:
+        f.write('bin/script\n/opt/placeholder binary "lib/lib a.so"\n')
+    monkeypatch.setattr(environ, 'pkgs_dirs', [testing_workdir])
+    assert environ._package_has_prefix('pkg-1.0-0') == {'bin/script': 'text',
+                                                        'lib/lib a.so': 'binary'}
+    assert environ._package_has_prefix('other-1.0-0') == {}
+
+
+def test_env_template_key_has_package_md5():
+    actions = {'LINK': ['local::pkg-1.0-0']}
+    key = environ._env_template_key(actions, {'local::pkg-1.0-0': {'md5': 'a' * 32}}, subdir)
+    # the same package, rebuilt
+    assert key != environ._env_template_key(actions, {'local::pkg-1.0-0': {'md5': 'b' * 32}},
+                                            subdir)
+    assert environ._env_template_key(actions, {}, subdir) is None
+
+
+def test_update_env_keeps_unchanged_env(testing_workdir, testing_config, mocker):
+    testing_config.env_templates = False
+    prefix = os.path.join(testing_workdir, '_env')
+    index, _ = environ.get_build_index(testing_config, testing_config.build_subdir)
+    actions = environ.get_install_actions(os.path.join(testing_workdir, '_solve'), index,
+                                          ['python'], testing_config,
+                                          subdir=testing_config.build_subdir)
+    environ.update_env(prefix, actions, testing_config, subdir=testing_config.build_subdir)
+    baseline = environ.prefix_file_stats(prefix)
+
+    with open(os.path.join(prefix, 'left_by_output'), 'w') as f:
+        f.write('abc')
+    create = mocker.spy(environ, 'create_env')
+    environ.update_env(prefix, actions, testing_config, subdir=testing_config.build_subdir,
+                       baseline_files=baseline)
+    assert create.call_count == 0
+    assert environ.prefix_file_stats(prefix) == baseline
+
+    # without a baseline, the env is created from scratch
+    environ.update_env(prefix, actions, testing_config, subdir=testing_config.build_subdir)
+    assert create.call_count == 1
+
+    # and so it is when a file an output's script changed
+    baseline = environ.prefix_file_stats(prefix)
+    meta_dir = os.path.join(prefix, 'conda-meta')
+    with open(os.path.join(meta_dir, os.listdir(meta_dir)[0]), 'a') as f:
+        f.write(' ')
+    environ.update_env(prefix, actions, testing_config, subdir=testing_config.build_subdir,
+                       baseline_files=baseline)
+    assert create.call_count == 2
+
+
+def test_update_env_failure_recreates_env(testing_workdir, testing_config, mocker):
+    prefix = os.path.join(testing_workdir, '_env')
+    os.makedirs(os.path.join(prefix, 'conda-meta'))
+    baseline = environ.prefix_file_stats(prefix)
+    mocker.patch.object(environ, 'linked', return_value=['old-1.0-0'])
+    create = mocker.patch.object(environ, 'create_env',
+                                 side_effect=[environ.CondaError('failed'), None])
+    actions = {'PREFIX': prefix, 'LINK': ['new-1.0-0', 'other-1.0-0']}
+    environ.update_env(prefix, actions, testing_config, subdir=testing_config.build_subdir,
+                       baseline_files=baseline)
+    delta, full = [call[0][1] for call in create.call_args_list]
+    assert delta['UNLINK'] == ['old-1.0-0']
+    assert create.call_args_list[0][1]['retry_on_error'] is False
+    # the retry is from scratch, with every package
+    assert full['LINK'] == actions['LINK'] and not full.get('UNLINK')
+    assert not os.path.exists(prefix)
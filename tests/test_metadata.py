@@ -1,11 +1,15 @@
+import copy
 import os
+import pickle
 import subprocess
 import sys
 
+import jinja2
 import pytest
 
-from conda_build.metadata import select_lines, MetaData
+from conda_build.metadata import select_lines, MetaData, CopyOnWriteDict, toposort, ns_cfg
 from conda_build import api, conda_interface
+from conda_build.utils import HashableDict
 from .utils import thisdir, metadata_dir
 
 
@@ -70,6 +74,34 @@ test {{ JINJA_VAR[:2] }}
 """
 
 
+def test_select_lines_unknown_and_invalid_selectors():
+    lines = "a  # [win and not foo]\nb  # [linux]\nc  # [win and not foo]\n"
+    # unknown names are treated as False
+    assert select_lines(lines, {'win': True, 'linux': False}) == "a\nc\n"
+    assert select_lines(lines, {'win': False, 'linux': True}) == "b\n"
+    with pytest.raises(SystemExit) as exc:
+        select_lines("a\nb  # [linux and]\n", {'linux': True})
+    assert 'line 2' in str(exc.value)
+
+
+def test_ns_cfg_follows_variant_and_environment(testing_config, monkeypatch):
+    testing_config.variant = {'python': '2.7'}
+    ns = ns_cfg(testing_config)
+    assert ns['py'] == 27 and ns['py2k']
+    assert 'NS_CFG_TEST' not in ns
+
+    monkeypatch.setenv('NS_CFG_TEST', 'abc')
+    testing_config.variant = {'python': '3.6'}
+    ns = ns_cfg(testing_config)
+    assert ns['py'] == 36 and ns['py3k']
+    assert ns['NS_CFG_TEST'] == 'abc'
+    # the namespace is shared with later calls, so callers can't change it
+    assert ns_cfg(testing_config) is ns
+    with pytest.raises(TypeError):
+        ns['py'] = 0
+    assert ns_cfg(testing_config)['py'] == 36
+
+
 def test_disallow_leading_period_in_version(testing_metadata):
     testing_metadata.meta['package']['version'] = '.ste.ve'
     testing_metadata.final = True
@@ -213,8 +245,171 @@ def test_hash_applies_to_custom_build_string(testing_metadata):
     assert testing_metadata.build_id() == 'stevehbcfeb9f'
 
 
+def test_hash_follows_recipe_file_changes(testing_workdir, testing_config):
+    recipe_dir = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe_dir)
+    _write_recipe(recipe_dir, "package:\n  name: abc\n  version: 1.0\n")
+    with open(os.path.join(recipe_dir, 'build.sh'), 'w') as f:
+        f.write('echo one\n')
+    m = MetaData(recipe_dir, config=testing_config)
+    first = m._hash_dependencies()
+    assert m._hash_dependencies() == first
+
+    with open(os.path.join(recipe_dir, 'build.sh'), 'w') as f:
+        f.write('echo two, with a different size\n')
+    second = m._hash_dependencies()
+    assert second != first
+
+    # new files are picked up, too
+    with open(os.path.join(recipe_dir, 'patch.diff'), 'w') as f:
+        f.write('patch\n')
+    assert m._hash_dependencies() not in (first, second)
+
+
+def test_build_id_cached_while_final(testing_metadata, mocker):
+    testing_metadata.final = True
+    hash_dependencies = mocker.spy(testing_metadata, '_hash_dependencies')
+    build_id = testing_metadata.build_id()
+    for _ in range(3):
+        assert testing_metadata.dist().endswith(build_id)
+    assert hash_dependencies.call_count == 1
+
+    testing_metadata.final = False
+    testing_metadata.meta['requirements']['build'] = ['zlib 1.2.8 3']
+    assert testing_metadata.build_id() != build_id
+
+
 def test_config_member_decoupling(testing_metadata):
     testing_metadata.config.some_member = 'abc'
     b = testing_metadata.copy()
     b.config.some_member = '123'
     assert b.config.some_member != testing_metadata.config.some_member
+
+
+def _write_recipe(recipe_dir, contents):
+    with open(os.path.join(recipe_dir, 'meta.yaml'), 'w') as f:
+        f.write(contents)
+
+
+def test_rendered_template_cache(testing_workdir, testing_config, mocker):
+    recipe_dir = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe_dir)
+    _write_recipe(recipe_dir, "package:\n  name: {{ name }}\n  version: 1.0\n")
+    m = MetaData(recipe_dir, config=testing_config)
+    assert m.undefined_jinja_vars == ['name']
+
+    render = mocker.spy(jinja2.Template, 'render')
+    m.parse_again(permit_undefined_jinja=True)
+    assert render.call_count == 0
+    assert m.undefined_jinja_vars == ['name']
+
+    # changes to the recipe must not be masked by the cache
+    _write_recipe(recipe_dir, "package:\n  name: {{ 'abc' }}\n  version: 1.0\n")
+    m.parse_again(permit_undefined_jinja=True)
+    assert render.call_count == 1
+    assert m.name() == 'abc'
+
+
+def test_rendered_template_cache_skips_context_functions(testing_workdir, testing_config,
+                                                          mocker):
+    recipe_dir = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe_dir)
+    _write_recipe(recipe_dir, "package:\n"
+                              "  name: {{ load_file_regex(load_file='nope', regex_pattern='x') }}"
+                              "abc\n"
+                              "  version: 1.0\n")
+    m = MetaData(recipe_dir, config=testing_config)
+    render = mocker.spy(jinja2.Template, 'render')
+    m.parse_again(permit_undefined_jinja=True)
+    assert render.call_count == 1
+
+
+def test_jinja_environment_reused_across_variants(testing_workdir, testing_config, mocker):
+    recipe_dir = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe_dir)
+    _write_recipe(recipe_dir, "package:\n  name: pkg-{{ foo }}\n  version: 1.0\n"
+                              "build:\n  string: old_py  # [py27]\n"
+                              "  string: new_py  # [not py27]\n")
+    m = MetaData(recipe_dir, config=testing_config)
+    compile = mocker.spy(jinja2.Environment, 'compile')
+    # a 200 entry variant matrix, alternating between two sets of selected lines
+    for i in range(200):
+        m.config.variant = {'foo': str(i), 'python': '2.7' if i % 2 else '3.6'}
+        m.parse_again(permit_undefined_jinja=False)
+        assert m.name() == 'pkg-{}'.format(i)
+        assert m.get_value('build/string') == ('old_py' if i % 2 else 'new_py')
+    # each selection of lines is compiled once, then reused
+    assert compile.call_count == 2
+
+
+def test_copy_on_write_dict():
+    original = CopyOnWriteDict(build={'number': 0}, about={'license': 'BSD'})
+    copied = original.copy()
+    assert copied == original
+    # nothing is copied until it is looked up
+    assert copied._shared == {'build', 'about'}
+    copied['build']['number'] = 1
+    original.get('about')['license'] = 'MIT'
+    assert original['build'] == {'number': 0}
+    assert copied['about'] == {'license': 'BSD'}
+    assert copied._shared == set()
+    # copies of copies still share untouched values
+    again = copied.copy()
+    again.setdefault('build', {})['string'] = 'abc'
+    assert 'string' not in copied['build']
+    assert copy.deepcopy(again) == again
+    assert pickle.loads(pickle.dumps(again)) == again
+
+
+def test_copy_on_write_dict_copied_as_dict():
+    original = CopyOnWriteDict(build={'number': 0})
+    copied = original.copy()
+    dict(copied)['build']['number'] = 1
+    plain = {}
+    plain.update(copied)
+    plain['build']['number'] = 2
+    assert original['build'] == {'number': 0}
+
+
+def test_metadata_copy_is_independent(testing_metadata):
+    testing_metadata.meta['requirements']['build'] = ['python']
+    name = testing_metadata.name()
+    new = testing_metadata.copy()
+    new.meta['requirements']['build'].append('numpy')
+    new.meta['package']['name'] = 'other'
+    assert testing_metadata.meta['requirements']['build'] == ['python']
+    assert testing_metadata.name() == name
+    assert new.name() == 'other'
+
+
+def test_toposort_many_outputs(testing_config):
+    # a synthetic recipe with 500 outputs: each depends on the one before it, and every tenth
+    #    one also depends on the first
+    n_outputs = 500
+    output_metadata_map = {}
+    for i in reversed(range(n_outputs)):
+        deps = ['out{:03d} 1.0'.format(i - 1)] if i else []
+        if i and not i % 10:
+            deps.append('out000')
+        meta = {'package': {'name': 'out{:03d}'.format(i), 'version': '1.0'},
+                'requirements': {'build': deps + ['python']}}
+        output_d = HashableDict(name=meta['package']['name'])
+        output_metadata_map[output_d] = MetaData.fromdict(meta, config=testing_config)
+    # non-conda outputs are not part of the ordering
+    output_metadata_map[HashableDict(name='wheel', type='wheel')] = MetaData.fromdict(
+        {'package': {'name': 'wheel', 'version': '1.0'}}, config=testing_config)
+
+    ordered = toposort(output_metadata_map, phase='build')
+    assert [output_d['name'] for output_d in ordered] == ['out{:03d}'.format(i)
+                                                         for i in range(n_outputs)]
+
+
+def test_toposort_cycle(testing_config):
+    output_metadata_map = {}
+    for name, dep in (('a', 'b'), ('b', 'a')):
+        meta = {'package': {'name': name, 'version': '1.0'},
+                'requirements': {'build': [dep]}}
+        output_metadata_map[HashableDict(name=name)] = MetaData.fromdict(meta,
+                                                                        config=testing_config)
+    with pytest.raises(ValueError):
+        toposort(output_metadata_map, phase='build')
@@ -1,5 +1,6 @@
 import os
-from conda_build import api
+from conda_build import api, render
+from conda_build.index import index_fingerprint
 
 
 def test_output_with_noarch_says_noarch(testing_metadata):
@@ -16,3 +17,19 @@ def test_output_with_noarch_python_says_noarch(testing_metadata):
 
 # no tests here - this is tested at a high level in test_cli.py and in test_api_render.py.
 #   tests here should be lower-level unit tests of the render.py functionality.
+
+
+def test_render_cache_skips_included_templates(testing_workdir, testing_config):
+    recipe = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe)
+    with open(os.path.join(recipe, 'meta.yaml'), 'w') as f:
+        f.write("{% include 'elsewhere.yaml' %}\npackage:\n  name: cached\n  version: 1.0\n")
+    assert render.render_cache_key(recipe, testing_config) is None
+
+
+def test_index_fingerprint_has_record_contents():
+    index = {'pkg-1.0-0': {'md5': 'a' * 32, 'depends': ['python']}}
+    patched = {'pkg-1.0-0': {'md5': 'a' * 32, 'depends': ['python >=3']}}
+    rebuilt = {'pkg-1.0-0': {'md5': 'b' * 32, 'depends': ['python']}}
+    fingerprints = set(index_fingerprint(i) for i in (index, patched, rebuilt))
+    assert len(fingerprints) == 3
@@ -198,3 +198,35 @@ def test_filter_files():
     files_list = ['a', 'x.git/a', 'something/x.git/a',
                   'x.git\\a', 'something\\x.git\\a']
     assert len(utils.filter_files(files_list, '')) == len(files_list)
+
+
+def test_file_digests(testing_workdir):
+    path = os.path.join(testing_workdir, 'digest_me')
+    with open(path, 'wb') as f:
+        f.write(b'abc')
+    assert utils.file_digests(path) == {
+        'md5': '900150983cd24fb0d6963f7d28e17f72',
+        'sha256': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'}
+
+    info = utils.file_info(path)
+    assert info['size'] == 3
+    assert info['md5'] == '900150983cd24fb0d6963f7d28e17f72'
+
+    # changing the file invalidates the cached digests
+    os.remove(path)
+    with open(path, 'wb') as f:
+        f.write(b'abcd')
+    assert utils.file_digests(path)['md5'] == 'e2fc714c4727ee9395f324cd2e7f331f'
+
+
+def test_lru_cache():
+    cache = utils.LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache['a'] == 1
+    # 'b' is the least recently used now
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
@@ -3,7 +3,9 @@ import os
 import pytest
 import yaml
 
-from conda_build import api, exceptions, variants
+from conda_build import api, exceptions, render, variants
+from conda_build.metadata import MetaData
+from conda_build.render import distribute_variants
 
 global_specs = {"python": ["2.7.*", "3.5.*"],
                 "numpy": ["1.10.*", "1.11.*"]}
@@ -80,6 +82,15 @@ def test_combine_variants():
     assert combined['dict']['some'] == 'other'
 
 
+def test_default_variants_are_copies():
+    defaults = variants.get_default_variants()
+    defaults[0]['python'] = 'abc'
+    defaults[0]['pin_run_as_build']['python']['max_pin'] = 'x'
+    fresh = variants.get_default_variants()[0]
+    assert fresh['python'] != 'abc'
+    assert fresh['pin_run_as_build']['python']['max_pin'] == 'x.x'
+
+
 def test_variant_with_numpy_not_pinned_reduces_matrix():
     # variants are defined in yaml file in this folder
     # there are two python versions and two numpy versions.  However, because numpy is not pinned,
@@ -98,6 +109,21 @@ def test_variant_with_numpy_pinned_has_matrix():
     assert len(metadata) == 4
 
 
+def test_render_variants_in_parallel(mocker):
+    recipe = os.path.join(recipe_dir, '04_numpy_matrix_pinned')
+    serial = api.render(recipe, render_cache=False)
+    in_parallel = mocker.spy(render, '_render_variants_in_parallel')
+    parallel = api.render(recipe, render_jobs=2, render_cache=False)
+    assert in_parallel.call_count == 1
+    assert len(parallel) == 4
+    # same results, in the same order
+    assert [m.dist() for (m, _, _) in parallel] == [m.dist() for (m, _, _) in serial]
+    # workers render in their own copies of the work dir, and hand back metadata using the
+    #    build's own
+    for (m, _, _) in parallel:
+        assert m.config.work_dir == os.path.join(m.config.build_folder, 'work')
+
+
 def test_pinning_in_build_requirements():
     recipe = os.path.join(recipe_dir, '05_compatible')
     metadata = api.render(recipe)[0][0]
@@ -159,3 +185,20 @@ def test_variants_in_output_names():
     recipe = os.path.join(recipe_dir, '11_variant_output_names')
     outputs = api.get_output_file_paths(recipe)
     assert len(outputs) == 4
+
+
+def test_variants_differing_only_in_unused_keys_are_parsed_once(testing_workdir, testing_config,
+                                                                 mocker):
+    recipe = os.path.join(testing_workdir, 'recipe')
+    os.makedirs(recipe)
+    with open(os.path.join(recipe, 'meta.yaml'), 'w') as f:
+        f.write("package:\n  name: pkg-{{ foo }}\n  version: 1.0\n")
+    m = MetaData(recipe, config=testing_config)
+    parse = mocker.spy(MetaData, 'parse_until_resolved')
+    matrix = [{'foo': foo, 'unused': str(i), 'python': '3.6', 'target_platform': 'linux-64'}
+              for i in range(10) for foo in ('a', 'b')]
+    rendered = distribute_variants(m, matrix)
+    assert parse.call_count == 2
+    assert [mv.name() for (mv, _, _) in rendered] == ['pkg-a', 'pkg-b']
+    # the last of the identical variants is kept, as it was when they were all rendered
+    assert [mv.config.variant['unused'] for (mv, _, _) in rendered] == ['9', '9']